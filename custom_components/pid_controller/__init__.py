@@ -9,93 +9,435 @@ For more details about this sensor, please refer to the documentation at
 https://github.com/soloam/ha-pid-controller/
 """
 import logging
-from distutils import util
+from datetime import timedelta
+from pathlib import Path
+from time import perf_counter
 
 import homeassistant.helpers.config_validation as cv
-from homeassistant.core import HomeAssistant
-from homeassistant.helpers.service import verify_domain_control
+from homeassistant.core import (
+    HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+)
 from homeassistant.const import ATTR_ENTITY_ID
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.service import async_extract_referenced_entity_ids
 from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.json import json_dumps
+from homeassistant.util import dt as dt_util
+from homeassistant.util.file import write_utf8_file
+from homeassistant.util.json import json_loads
 
 import voluptuous as vol
 
 # pylint: disable=wildcard-import, unused-wildcard-import
 from .const import *
+from .jobs import JobRunner
+from .monitor import LoadMonitor, OscillationMonitor
 
 __version__ = VERSION
 
 _LOGGER = logging.getLogger(__name__)
 
-SERVICE_SCHEMA = vol.Schema(
+CONFIG_SCHEMA = vol.Schema(
+    {
+        vol.Optional(COMPONENT_DOMAIN, default={}): vol.All(
+            lambda value: value or {},
+            {
+                vol.Optional(
+                    CONF_MAX_JOBS, default=DEFAULT_MAX_JOBS
+                ): cv.positive_int,
+                vol.Optional(
+                    CONF_OSCILLATION_INTERVAL, default=DEFAULT_OSCILLATION_INTERVAL
+                ): cv.positive_int,
+                vol.Optional(
+                    CONF_LAG_THRESHOLD, default=DEFAULT_LAG_THRESHOLD
+                ): vol.All(vol.Coerce(float), vol.Range(min=0, min_included=False)),
+                vol.Optional(CONF_MAX_STRETCH, default=DEFAULT_MAX_STRETCH): vol.All(
+                    vol.Coerce(float), vol.Range(min=1)
+                ),
+            },
+        )
+    },
+    extra=vol.ALLOW_EXTRA,
+)
+
+SERVICE_SCHEMA = cv.make_entity_service_schema({})
+
+SIMULATE_SCHEMA = vol.Schema(
     {
         vol.Required(ATTR_ENTITY_ID): cv.entity_id,
+        vol.Optional(CONF_PROPORTIONAL): vol.Coerce(float),
+        vol.Optional(CONF_INTEGRAL): vol.Coerce(float),
+        vol.Optional(CONF_DERIVATIVE): vol.Coerce(float),
+        vol.Exclusive(ATTR_START, "period"): cv.datetime,
+        vol.Exclusive(ATTR_DURATION, "period"): cv.time_period,
+        vol.Optional(ATTR_END): cv.datetime,
+    }
+)
+
+# Target is optional, without one all controllers are used
+STATE_SCHEMA = vol.Schema(
+    {
+        vol.Remove("metadata"): dict,
+        vol.Optional(ATTR_FILENAME): cv.string,
+        **cv.ENTITY_SERVICE_FIELDS,
     }
 )
 
+
 # pylint: disable=unused-argument
 async def async_setup(hass: HomeAssistant, config):
     """Set up a pid."""
 
     _LOGGER.debug("setup")
 
-    async def async_pid_service_reset(call) -> None:
+    conf = config.get(COMPONENT_DOMAIN, {})
+    data = hass.data.setdefault(COMPONENT_DOMAIN, {})
+    data[DATA_JOB_RUNNER] = JobRunner(hass, conf.get(CONF_MAX_JOBS, DEFAULT_MAX_JOBS))
+    data[DATA_OSCILLATION_MONITOR] = OscillationMonitor(
+        hass, conf.get(CONF_OSCILLATION_INTERVAL, DEFAULT_OSCILLATION_INTERVAL)
+    )
+    data[DATA_LOAD_MONITOR] = LoadMonitor(
+        hass,
+        conf.get(CONF_LAG_THRESHOLD, DEFAULT_LAG_THRESHOLD),
+        conf.get(CONF_MAX_STRETCH, DEFAULT_MAX_STRETCH),
+    )
+
+    async def async_pid_service_reset(call) -> ServiceResponse:
         """Call pid service handler."""
         _LOGGER.info("%s service called", call.service)
-        await pid_reset_service(hass, call)
+        return await pid_reset_service(hass, call)
 
     hass.services.async_register(
         COMPONENT_DOMAIN,
         SERVICE_RESET_PID,
         async_pid_service_reset,
         schema=SERVICE_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
     )
 
-    async def async_pid_service_autotune(call) -> None:
+    async def async_pid_service_autotune(call) -> ServiceResponse:
         """Call pid service handler."""
         _LOGGER.info("%s service called", call.service)
-        await pid_autotune_service(hass, call)
+        return await pid_autotune_service(hass, call)
 
     hass.services.async_register(
         COMPONENT_DOMAIN,
         SERVICE_AUTOTUNE,
         async_pid_service_autotune,
         schema=SERVICE_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+    async def async_pid_service_cancel_autotune(call) -> ServiceResponse:
+        """Call pid service handler."""
+        _LOGGER.info("%s service called", call.service)
+        return await pid_cancel_autotune_service(hass, call)
+
+    hass.services.async_register(
+        COMPONENT_DOMAIN,
+        SERVICE_CANCEL_AUTOTUNE,
+        async_pid_service_cancel_autotune,
+        schema=SERVICE_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+    async def async_pid_service_simulate(call) -> ServiceResponse:
+        """Call pid service handler."""
+        _LOGGER.info("%s service called", call.service)
+        return await pid_simulate_service(hass, call)
+
+    hass.services.async_register(
+        COMPONENT_DOMAIN,
+        SERVICE_SIMULATE,
+        async_pid_service_simulate,
+        schema=SIMULATE_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+
+    async def async_pid_service_export_state(call) -> ServiceResponse:
+        """Call pid service handler."""
+        _LOGGER.info("%s service called", call.service)
+        return await pid_export_state_service(hass, call)
+
+    hass.services.async_register(
+        COMPONENT_DOMAIN,
+        SERVICE_EXPORT_STATE,
+        async_pid_service_export_state,
+        schema=STATE_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+    async def async_pid_service_import_state(call) -> ServiceResponse:
+        """Call pid service handler."""
+        _LOGGER.info("%s service called", call.service)
+        return await pid_import_state_service(hass, call)
+
+    hass.services.async_register(
+        COMPONENT_DOMAIN,
+        SERVICE_IMPORT_STATE,
+        async_pid_service_import_state,
+        schema=STATE_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
     )
 
     return True
 
 
-def get_entity_from_domain(hass: HomeAssistant, domain, entity_id):
-    component = hass.data.get(domain)
-    if component is None:
-        raise HomeAssistantError(f"{domain} component not set up")
+async def get_entities_from_call(hass: HomeAssistant, call: ServiceCall):
+    """Resolve every entity targeted by a call, looking up each domain once.
+    Areas and devices only expand to the controllers in them"""
 
-    entity = component.get_entity(entity_id)
-    if entity is None:
-        raise HomeAssistantError(f"{entity_id} not found")
+    selected = async_extract_referenced_entity_ids(hass, call)
+    registry = er.async_get(hass)
+    entity_ids = set(selected.referenced)
+    for entity_id in selected.indirectly_referenced:
+        entry = registry.async_get(entity_id)
+        if entry is not None and entry.platform == COMPONENT_DOMAIN:
+            entity_ids.add(entity_id)
+
+    if not entity_ids:
+        raise HomeAssistantError(f"{call.service} has no target entities")
+
+    components = {}
+    entities = {}
+    for entity_id in sorted(entity_ids):
+        domain = entity_id.split(".")[0]
+        if domain not in components:
+            components[domain] = hass.data.get(domain)
+
+        component = components[domain]
+        entities[entity_id] = (
+            component.get_entity(entity_id) if component is not None else None
+        )
+
+    return entities
 
-    return entity
+
+def run_pid_service(entities, action, method) -> ServiceResponse:
+    """Run a PID method on all entities in one pass, with a result per entity"""
+
+    results = {}
+    for entity_id, entity in entities.items():
+        if entity is None:
+            results[entity_id] = {ATTR_SUCCESS: False, ATTR_ERROR: "not found"}
+            continue
+
+        try:
+            getattr(entity, method)()
+        except AttributeError:
+            results[entity_id] = {
+                ATTR_SUCCESS: False,
+                ATTR_ERROR: f"can't {action} PID",
+            }
+        except HomeAssistantError as ex:
+            results[entity_id] = {ATTR_SUCCESS: False, ATTR_ERROR: str(ex)}
+        else:
+            results[entity_id] = {ATTR_SUCCESS: True}
+
+    if not any(result[ATTR_SUCCESS] for result in results.values()):
+        raise HomeAssistantError(
+            "; ".join(
+                f"{entity_id} {result[ATTR_ERROR]}"
+                for entity_id, result in results.items()
+            )
+        )
+
+    return results
 
 
 async def pid_reset_service(hass: HomeAssistant, call):
-    entity_id = call.data["entity_id"]
-    domain = entity_id.split(".")[0]
+    entities = await get_entities_from_call(hass, call)
 
-    _LOGGER.info("%s reset pid", entity_id)
+    _LOGGER.info("%s reset pid", ", ".join(entities))
 
-    try:
-        get_entity_from_domain(hass, domain, entity_id).reset_pid()
-    except AttributeError:
-        raise HomeAssistantError(f"{entity_id} can't reset PID") from AttributeError
+    return run_pid_service(entities, "reset", "reset_pid")
 
 
 async def pid_autotune_service(hass: HomeAssistant, call):
-    entity_id = call.data["entity_id"]
-    domain = entity_id.split(".")[0]
+    entities = await get_entities_from_call(hass, call)
+
+    _LOGGER.info("%s autotune pid", ", ".join(entities))
+
+    return run_pid_service(entities, "autotune", "start_autotune")
+
+
+async def pid_cancel_autotune_service(hass: HomeAssistant, call):
+    entities = await get_entities_from_call(hass, call)
+
+    _LOGGER.info("%s cancel autotune pid", ", ".join(entities))
+
+    return run_pid_service(entities, "cancel autotune", "cancel_autotune")
 
-    _LOGGER.info("%s autotune pid", entity_id)
+
+async def pid_simulate_service(hass: HomeAssistant, call):
+    entity_id, entity = next(iter((await get_entities_from_call(hass, call)).items()))
+    if entity is None:
+        raise HomeAssistantError(f"{entity_id} not found")
+
+    end = dt_util.as_utc(call.data.get(ATTR_END, dt_util.utcnow()))
+    start = (
+        dt_util.as_utc(call.data[ATTR_START])
+        if ATTR_START in call.data
+        else end
+        - call.data.get(ATTR_DURATION, timedelta(seconds=DEFAULT_SIMULATE_DURATION))
+    )
+    if start >= end:
+        raise HomeAssistantError(f"{ATTR_START} must be before {ATTR_END}")
+
+    _LOGGER.info("%s simulate pid from %s to %s", entity_id, start, end)
 
     try:
-        get_entity_from_domain(hass, domain, entity_id).start_autotune()
+        simulate = entity.async_simulate
     except AttributeError:
-        raise HomeAssistantError(f"{entity_id} can't reset PID") from AttributeError
+        raise HomeAssistantError(f"{entity_id} can't simulate PID") from AttributeError
+
+    gains = {
+        field: call.data.get(field)
+        for field in (CONF_PROPORTIONAL, CONF_INTEGRAL, CONF_DERIVATIVE)
+    }
+
+    return await simulate(gains, start, end)
+
+
+async def get_controllers_from_call(hass: HomeAssistant, call: ServiceCall):
+    """Resolve the targeted entities, or all controllers without a target"""
+
+    if any(field in call.data for field in cv.ENTITY_SERVICE_FIELDS):
+        return await get_entities_from_call(hass, call)
+
+    controllers = hass.data.get(COMPONENT_DOMAIN, {}).get(DATA_CONTROLLERS, {})
+    return dict(sorted(controllers.items()))
+
+
+async def get_state_filename(hass: HomeAssistant, call: ServiceCall) -> str:
+    """The state file of a call, relative to the config folder"""
+
+    filename = hass.config.path(call.data.get(ATTR_FILENAME, DEFAULT_STATE_FILE))
+    if not await hass.async_add_executor_job(is_state_file_allowed, hass, filename):
+        raise HomeAssistantError(f"{filename} is not an allowed path")
+
+    return filename
+
+
+def is_state_file_allowed(hass: HomeAssistant, filename) -> bool:
+    """If the file is in the config folder or an allowed external
+    directory, resolving the path blocks"""
+
+    config_dir = Path(hass.config.config_dir).resolve()
+    if Path(filename).resolve().is_relative_to(config_dir):
+        return True
+
+    return hass.config.is_allowed_path(filename)
+
+
+def write_state_file(filename, document) -> None:
+    write_utf8_file(filename, json_dumps(document))
+
+
+def read_state_file(filename):
+    with open(filename, encoding="utf-8") as file:
+        return json_loads(file.read())
+
+
+async def pid_export_state_service(hass: HomeAssistant, call):
+    entities = await get_controllers_from_call(hass, call)
+    filename = await get_state_filename(hass, call)
+
+    start = perf_counter()
+    controllers = {}
+    for entity_id, entity in entities.items():
+        try:
+            controllers[entity_id] = entity.export_state()
+        except AttributeError:
+            _LOGGER.warning("%s can't export PID state", entity_id)
+
+    await hass.async_add_executor_job(
+        write_state_file,
+        filename,
+        {ATTR_VERSION: STATE_VERSION, ATTR_CONTROLLERS: controllers},
+    )
+
+    _LOGGER.info(
+        "%d pid states exported to %s in %.3fs",
+        len(controllers),
+        filename,
+        perf_counter() - start,
+    )
+
+    return {ATTR_FILENAME: filename, ATTR_CONTROLLERS: list(controllers)}
+
+
+async def pid_import_state_service(hass: HomeAssistant, call):
+    filename = await get_state_filename(hass, call)
+
+    try:
+        document = await hass.async_add_executor_job(read_state_file, filename)
+    except (OSError, ValueError) as ex:
+        raise HomeAssistantError(f"can't read {filename}: {ex}") from ex
+
+    if not isinstance(document, dict) or document.get(ATTR_VERSION) != STATE_VERSION:
+        raise HomeAssistantError(
+            f"{filename} is not a PID state version {STATE_VERSION}"
+        )
+
+    snapshots = document.get(ATTR_CONTROLLERS) or {}
+    if any(field in call.data for field in cv.ENTITY_SERVICE_FIELDS):
+        targets = await get_entities_from_call(hass, call)
+    else:
+        targets = {
+            entity_id: hass.data.get(COMPONENT_DOMAIN, {})
+            .get(DATA_CONTROLLERS, {})
+            .get(entity_id)
+            for entity_id in sorted(snapshots)
+        }
+
+    start = perf_counter()
+
+    # Check everything first, so a bad document changes nothing
+    results = {}
+    imports = []
+    for entity_id, entity in targets.items():
+        if entity is None:
+            results[entity_id] = {ATTR_SUCCESS: False, ATTR_ERROR: "not found"}
+        elif entity_id not in snapshots:
+            results[entity_id] = {ATTR_SUCCESS: False, ATTR_ERROR: "not in file"}
+        else:
+            try:
+                entity.check_state(snapshots[entity_id])
+            except AttributeError:
+                results[entity_id] = {
+                    ATTR_SUCCESS: False,
+                    ATTR_ERROR: "can't import PID state",
+                }
+            except (KeyError, TypeError, ValueError) as ex:
+                raise HomeAssistantError(
+                    f"{filename} has an invalid state for {entity_id}: {ex!r}"
+                ) from ex
+            else:
+                imports.append((entity_id, entity))
+
+    for entity_id, entity in imports:
+        entity.import_state(snapshots[entity_id])
+        entity.async_write_ha_state()
+        results[entity_id] = {ATTR_SUCCESS: True}
+
+    _LOGGER.info(
+        "%d pid states imported from %s in %.3fs",
+        len(imports),
+        filename,
+        perf_counter() - start,
+    )
+
+    if not imports:
+        raise HomeAssistantError(
+            "; ".join(
+                f"{entity_id} {result[ATTR_ERROR]}"
+                for entity_id, result in results.items()
+            )
+            or f"{filename} has no controllers"
+        )
+
+    return results
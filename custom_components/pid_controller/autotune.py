@@ -0,0 +1,66 @@
+#
+#  Copyright (c) 2022, Diogo Silva "Soloam"
+#  Creative Commons BY-NC-SA 4.0 International Public License
+#  (see LICENSE.md or https://creativecommons.org/licenses/by-nc-sa/4.0/)
+#
+"""
+PID Controller.
+For more details about this sensor, please refer to the documentation at
+https://github.com/soloam/ha-pid-controller/
+"""
+from math import pi
+
+# pylint: disable=invalid-name
+
+
+def relay_autotune(context, samples, amplitude=50):
+    """Relay feedback autotune (Astrom-Hagglund).
+
+    While the relay toggles the output by +/- amplitude, the feedback
+    oscillates. From the oscillation the ultimate gain and period are measured
+    and the Ziegler-Nichols gains calculated.
+
+    samples is a list of (time, feedback, relay_on), context is the job
+    context used to report progress and check for cancellation.
+    """
+
+    switches = [
+        index
+        for index in range(1, len(samples))
+        if samples[index][2] != samples[index - 1][2]
+    ]
+
+    # The first half cycle is the transient, only measure full cycles after it
+    cycles = len(switches) - 2
+    if cycles < 1:
+        raise ValueError("not enough oscillations to autotune")
+
+    periods = []
+    heights = []
+    for cycle in range(cycles):
+        context.report_progress(cycle / cycles)
+
+        start = switches[cycle]
+        end = switches[cycle + 2]
+
+        values = [value for _, value, _ in samples[start:end]]
+        periods.append(samples[end][0] - samples[start][0])
+        heights.append(max(values) - min(values))
+
+    period = sum(periods) / len(periods)
+    height = sum(heights) / len(heights) / 2
+
+    if not period or not height:
+        raise ValueError("oscillation too small to autotune")
+
+    ku = 4 * amplitude / (pi * height)
+
+    context.report_progress(1)
+
+    return {
+        "ultimate_gain": ku,
+        "ultimate_period": period,
+        "p": 0.6 * ku,
+        "i": 1.2 * ku / period,
+        "d": 0.075 * ku * period,
+    }
@@ -9,6 +9,10 @@ For more details about this sensor, please refer to the documentation at
 https://github.com/soloam/ha-pid-controller/
 """
 
+# Constants of the controller core, shared with the headless runtime
+# pylint: disable=wildcard-import, unused-wildcard-import
+from .pidcore.const import *
+
 # Data
 COMPONENT_DOMAIN = "pid_controller"
 VERSION = "1.0.0"
@@ -17,6 +21,25 @@ VERSION = "1.0.0"
 COMPONENT_SERVICES = "pid-services"
 SERVICE_RESET_PID = "reset_pid"
 SERVICE_AUTOTUNE = "autotune_pid"
+SERVICE_CANCEL_AUTOTUNE = "cancel_autotune_pid"
+SERVICE_SIMULATE = "simulate"
+SERVICE_EXPORT_STATE = "export_state"
+SERVICE_IMPORT_STATE = "import_state"
+
+# Events
+EVENT_AUTOTUNE = "pid_controller_autotune"
+EVENT_OSCILLATION = "pid_controller_oscillation"
+EVENT_LOAD_SHEDDING = "pid_controller_load_shedding"
+
+# Runtime Data
+DATA_JOB_RUNNER = "job_runner"
+DATA_PENDING_STARTUP = "pending_startup"
+DATA_OSCILLATION_MONITOR = "oscillation_monitor"
+DATA_CONTROLLERS = "controllers"
+DATA_LOAD_MONITOR = "load_monitor"
+
+# Jobs
+JOB_OSCILLATION = "oscillation"
 
 # Configuration
 CONF_SETPOINT = "set_point"
@@ -29,24 +52,85 @@ CONF_ROUND = "round"
 CONF_SAMPLE_TIME = "sample_time"
 CONF_WINDUP = "windup"
 CONF_ENABLED = "enabled"
+CONF_MAX_JOBS = "max_jobs"
+CONF_OSCILLATION_INTERVAL = "oscillation_interval"
+CONF_LAG_THRESHOLD = "lag_threshold"
+CONF_MAX_STRETCH = "max_stretch"
+CONF_PRIORITY = "priority"
+CONF_FILTER_WINDOW = "filter_window"
+CONF_SOURCE_DELTA = "source_delta"
+CONF_AGGREGATION = "aggregation"
+CONF_WEIGHTS = "weights"
+CONF_RATE_LIMIT = "rate_limit"
+CONF_METRICS_WINDOW = "metrics_window"
+CONF_MAX_INTERVAL = "max_interval"
+CONF_OUTPUT_ENTITY = "output_entity"
+CONF_OUTPUT_SERVICE = "output_service"
+CONF_OUTPUT_FIELD = "output_field"
+CONF_OUTPUT_DELTA = "output_delta"
+CONF_OUTPUT_INTERVAL = "output_interval"
+CONF_BUMPLESS = "bumpless"
+CONF_SETPOINT_WEIGHT = "setpoint_weight"
+CONF_SETPOINT_RAMP = "setpoint_ramp"
+CONF_RESET_ON = "reset_on"
+CONF_OUTPUT_MIN = "output_min"
+CONF_OUTPUT_MAX = "output_max"
+CONF_ANTI_WINDUP = "anti_windup"
+CONF_TRACKING_TIME = "tracking_time"
+CONF_CONTROLLERS = "controllers"
+CONF_HYSTERESIS = "hysteresis"
+CONF_MIN_ON_TIME = "min_on_time"
+CONF_MIN_OFF_TIME = "min_off_time"
+CONF_PWM_ENTITY = "pwm_entity"
+CONF_PWM_CYCLE = "pwm_cycle"
+CONF_PWM_MIN_ON = "pwm_min_on"
+CONF_PWM_MIN_OFF = "pwm_min_off"
 
 # Default
 DEFAULT_NAME = "PID Controller"
-DEFAULT_PRECISION = 2
-DEFAULT_MINIMUM = 0
-DEFAULT_MAXIMUM = 1
-DEFAULT_ROUND = "round"
-DEFAULT_SAMPLE_TIME = 0
-DEFAULT_WINDUP = 20
 DEFAULT_UNIT_OF_MEASUREMENT = "points"
 DEFAULT_DEVICE_CLASS = "None"
 DEFAULT_ICON = "mdi:chart-bell-curve-cumulative"
 DEFAULT_ENABLED = True
+DEFAULT_MAX_JOBS = 2
+DEFAULT_OSCILLATION_INTERVAL = 300
+DEFAULT_LAG_THRESHOLD = 0.1
+DEFAULT_MAX_STRETCH = 10
+DEFAULT_PRIORITY = "normal"
+DEFAULT_SIMULATE_DURATION = 86400
+DEFAULT_STATE_FILE = "pid_controller_state.json"
+DEFAULT_OUTPUT_DELTA = 0
+DEFAULT_OUTPUT_INTERVAL = 0
+DEFAULT_BUMPLESS = False
+DEFAULT_HYSTERESIS = 0
+DEFAULT_MIN_ON_TIME = 0
+DEFAULT_MIN_OFF_TIME = 0
+DEFAULT_PWM_CYCLE = 600
+DEFAULT_PWM_MIN_ON = 0
+DEFAULT_PWM_MIN_OFF = 0
 
 # Other
-ROUND_FLOOR = "floor"
-ROUND_CEIL = "ceil"
-ROUND_ROUND = "round"
+AUTOTUNE_CYCLES = 4
+AUTOTUNE_TIMEOUT = 14400
+STATE_VERSION = 1
+
+# Priorities, under loop lag low ones are shed first, high ones never
+PRIORITY_HIGH = "high"
+PRIORITY_NORMAL = "normal"
+PRIORITY_LOW = "low"
+PRIORITIES = [PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW]
+LAG_PROBE_INTERVAL = 1
+
+# Service and field that set the output, by output entity domain
+OUTPUT_SERVICES = {
+    "number": ("number.set_value", "value"),
+    "input_number": ("input_number.set_value", "value"),
+    "valve": ("valve.set_valve_position", "position"),
+    "cover": ("cover.set_cover_position", "position"),
+    "fan": ("fan.set_percentage", "percentage"),
+    "light": ("light.turn_on", "brightness_pct"),
+    "climate": ("climate.set_temperature", "temperature"),
+}
 
 # Attributes
 ATTR_ENABLED = "enabled"
@@ -58,7 +142,9 @@ ATTR_PROPORTIONAL = "proportional"
 ATTR_INTEGRAL = "integral"
 ATTR_DERIVATIVE = "derivative"
 ATTR_SETPOINT = "set_point"
+ATTR_EFFECTIVE_SETPOINT = "effective_set_point"
 ATTR_SOURCE = "source"
+ATTR_FILTERED_SOURCE = "filtered_source"
 ATTR_PRECISION = "precision"
 ATTR_MINIMUM = "minimum"
 ATTR_MAXIMUM = "maximum"
@@ -68,6 +154,49 @@ ATTR_INVERT = "invert"
 ATTR_P = "p"
 ATTR_I = "i"
 ATTR_D = "d"
+ATTR_EVALUATED = "evaluated"
+ATTR_SKIPPED = "skipped"
+ATTR_DUPLICATES = "duplicates"
+ATTR_OUT_OF_ORDER = "out_of_order"
+ATTR_SWITCH_COUNT = "switch_count"
+ATTR_STRETCH = "stretch"
+ATTR_SHED = "shed"
+ATTR_IAE = "iae"
+ATTR_ISE = "ise"
+ATTR_ITAE = "itae"
+ATTR_OVERSHOOT = "overshoot"
+ATTR_SETTLING_TIME = "settling_time"
+ATTR_TRAVEL = "travel"
+ATTR_OSCILLATING = "oscillating"
+ATTR_OSCILLATION_PERIOD = "oscillation_period"
+ATTR_OSCILLATION_AMPLITUDE = "oscillation_amplitude"
+ATTR_OUTPUT_WRITES = "output_writes"
+ATTR_OUTPUT_COALESCED = "output_coalesced"
+ATTR_PWM_DUTY = "pwm_duty"
+ATTR_PWM_JITTER = "pwm_jitter"
+ATTR_PWM_MAX_JITTER = "pwm_max_jitter"
+ATTR_AUTOTUNE_PROGRESS = "autotune_progress"
+ATTR_AUTOTUNE_RESULT = "autotune_result"
+
+# Service Fields
+ATTR_START = "start"
+ATTR_END = "end"
+ATTR_DURATION = "duration"
+ATTR_FILENAME = "filename"
+
+# Service Results
+ATTR_SUCCESS = "success"
+ATTR_ERROR = "error"
+ATTR_GAINS = "gains"
+ATTR_VERSION = "version"
+ATTR_CONTROLLERS = "controllers"
+
+# Event Data
+ATTR_ACTIVE = "active"
+ATTR_LAG = "lag"
+ATTR_MAX_LAG = "max_lag"
+ATTR_ACTIVATIONS = "activations"
+ATTR_SHEDDING = "shedding"
 
 ATTR_TO_PROPERTY = [
     ATTR_ENABLED,
@@ -79,7 +208,9 @@ ATTR_TO_PROPERTY = [
     ATTR_INTEGRAL,
     ATTR_DERIVATIVE,
     ATTR_SETPOINT,
+    ATTR_EFFECTIVE_SETPOINT,
     ATTR_SOURCE,
+    ATTR_FILTERED_SOURCE,
     ATTR_PRECISION,
     ATTR_MINIMUM,
     ATTR_MAXIMUM,
@@ -89,4 +220,49 @@ ATTR_TO_PROPERTY = [
     ATTR_P,
     ATTR_I,
     ATTR_D,
+    ATTR_EVALUATED,
+    ATTR_SKIPPED,
+    ATTR_DUPLICATES,
+    ATTR_OUT_OF_ORDER,
+    ATTR_SWITCH_COUNT,
+    ATTR_STRETCH,
+    ATTR_SHED,
+    ATTR_IAE,
+    ATTR_ISE,
+    ATTR_ITAE,
+    ATTR_OVERSHOOT,
+    ATTR_SETTLING_TIME,
+    ATTR_TRAVEL,
+    ATTR_OSCILLATING,
+    ATTR_OSCILLATION_PERIOD,
+    ATTR_OSCILLATION_AMPLITUDE,
+    ATTR_OUTPUT_WRITES,
+    ATTR_OUTPUT_COALESCED,
+    ATTR_PWM_DUTY,
+    ATTR_PWM_JITTER,
+    ATTR_PWM_MAX_JITTER,
+    ATTR_AUTOTUNE_PROGRESS,
+    ATTR_AUTOTUNE_RESULT,
 ]
+
+# Metrics and counters change on every sample, a row each in the recorder
+ATTR_UNRECORDED = frozenset(
+    [
+        ATTR_EVALUATED,
+        ATTR_SKIPPED,
+        ATTR_DUPLICATES,
+        ATTR_OUT_OF_ORDER,
+        ATTR_SWITCH_COUNT,
+        ATTR_SHED,
+        ATTR_IAE,
+        ATTR_ISE,
+        ATTR_ITAE,
+        ATTR_OVERSHOOT,
+        ATTR_SETTLING_TIME,
+        ATTR_TRAVEL,
+        ATTR_OUTPUT_WRITES,
+        ATTR_OUTPUT_COALESCED,
+        ATTR_PWM_JITTER,
+        ATTR_PWM_MAX_JITTER,
+    ]
+)
@@ -0,0 +1,152 @@
+#
+#  Copyright (c) 2022, Diogo Silva "Soloam"
+#  Creative Commons BY-NC-SA 4.0 International Public License
+#  (see LICENSE.md or https://creativecommons.org/licenses/by-nc-sa/4.0/)
+#
+"""
+PID Controller.
+For more details about this sensor, please refer to the documentation at
+https://github.com/soloam/ha-pid-controller/
+"""
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import TemplateError
+from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers.event import TrackTemplate, async_track_template_result
+from homeassistant.helpers.template import Template
+
+# pylint: disable=wildcard-import, unused-wildcard-import
+from .const import *
+
+
+def shared_template(value) -> Template:
+    """Validate a template, keeping one already validated, so the
+    controllers of a fleet share the templates of the profile"""
+
+    if isinstance(value, Template):
+        return value
+
+    return cv.template(value)
+
+
+def share_templates(controllers, fields) -> set:
+    """Make equal templates of the controllers the same object, returns
+    the templates used by more than one controller"""
+
+    templates = {}
+    users = {}
+    for config in controllers:
+        for field in fields:
+            value = config.get(field)
+            if value is None:
+                continue
+
+            value = config[field] = templates.setdefault(value, value)
+            users.setdefault(value, set()).add(id(config))
+
+    return {value for value, configs in users.items() if len(configs) > 1}
+
+
+class TemplateGroup:
+    """Templates shared by the controllers of a fleet, tracked and rendered
+    once for all of them, the results are shared too"""
+
+    def __init__(self, hass: HomeAssistant, templates):
+        self._hass = hass
+        self._templates = set(templates)
+        self._results = {}
+        self._members = {}
+        self._member_rate_limits = {}
+        self._rate_limits = {}
+        self._info = None
+
+    @property
+    def templates(self) -> set:
+        """Returns the shared templates"""
+        return self._templates
+
+    @property
+    def results(self) -> dict:
+        """Returns the last results by template, for all members"""
+        return self._results
+
+    @property
+    def rate_limits(self) -> dict:
+        """Returns the rate limit by template, the lowest of all members, or
+        None if a member has none"""
+        return self._rate_limits
+
+    @callback
+    def async_register(self, member, template_fields, rate_limits=None):
+        """Add a controller with its fields and rate limits by shared
+        template, returns the callback to remove it. The templates are
+        tracked from the first, and tracked again when the rate limits of
+        the members change"""
+
+        self._members[member] = template_fields
+        self._member_rate_limits[member] = rate_limits or {}
+        self._async_track()
+
+        @callback
+        def unregister():
+            self._members.pop(member, None)
+            self._member_rate_limits.pop(member, None)
+            if self._members:
+                self._async_track()
+            elif self._info is not None:
+                self._info.async_remove()
+                self._info = None
+
+        return unregister
+
+    @callback
+    def _async_track(self) -> None:
+        """Track the templates with the rate limits of the members, a
+        member without one keeps the template unlimited"""
+
+        limits = {}
+        for member, template_fields in self._members.items():
+            member_limits = self._member_rate_limits[member]
+            for template in template_fields:
+                limits.setdefault(template, []).append(member_limits.get(template))
+
+        rate_limits = {
+            template: None if None in values else min(values)
+            for template, values in limits.items()
+        }
+        if self._info is not None and rate_limits == self._rate_limits:
+            return
+
+        self._rate_limits = rate_limits
+        if self._info is not None:
+            self._info.async_remove()
+
+        self._info = async_track_template_result(
+            self._hass,
+            [
+                TrackTemplate(template, None, self._rate_limits.get(template))
+                for template in self._templates
+            ],
+            self._async_template_listener,
+        )
+
+    # pylint: disable=unused-argument
+    @callback
+    def _async_template_listener(self, event, updates) -> None:
+        templates = []
+        for update in updates:
+            result = update.result
+            result = result if isinstance(result, TemplateError) else str(result)
+            # Results the members already rendered are not changes
+            if self._results.get(update.template) == result:
+                continue
+
+            self._results[update.template] = result
+            templates.append(update.template)
+
+        for member, template_fields in list(self._members.items()):
+            changed = set()
+            for changed_template in templates:
+                changed.update(template_fields.get(changed_template, []))
+
+            if changed:
+                member.async_templates_changed(changed)
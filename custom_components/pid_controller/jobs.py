@@ -0,0 +1,128 @@
+#
+#  Copyright (c) 2022, Diogo Silva "Soloam"
+#  Creative Commons BY-NC-SA 4.0 International Public License
+#  (see LICENSE.md or https://creativecommons.org/licenses/by-nc-sa/4.0/)
+#
+"""
+PID Controller.
+For more details about this sensor, please refer to the documentation at
+https://github.com/soloam/ha-pid-controller/
+"""
+import asyncio
+import logging
+import threading
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
+
+# pylint: disable=wildcard-import, unused-wildcard-import
+from .const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """Raised when a job is cancelled"""
+
+
+class JobContext:
+    """Handle given to a job running in the executor"""
+
+    def __init__(self, hass: HomeAssistant, name, on_progress=None):
+        self._hass = hass
+        self._name = name
+        self._on_progress = on_progress
+        self._cancelled = threading.Event()
+        self._progress = 0.0
+
+    @property
+    def name(self) -> str:
+        """Job Name"""
+        return self._name
+
+    @property
+    def progress(self) -> float:
+        """Last reported progress, between 0 and 1"""
+        return self._progress
+
+    @property
+    def cancelled(self) -> bool:
+        """If the job was asked to stop"""
+        return self._cancelled.is_set()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def check_cancelled(self) -> None:
+        """Stops the job, from inside, if it was cancelled"""
+        if self._cancelled.is_set():
+            raise JobCancelled(self._name)
+
+    def report_progress(self, progress) -> None:
+        """Report progress from the executor, also a cancellation point"""
+        self.check_cancelled()
+        self._hass.loop.call_soon_threadsafe(self._set_progress, progress)
+
+    @callback
+    def _set_progress(self, progress) -> None:
+        self._progress = progress
+        if self._on_progress is not None and not self.cancelled:
+            self._on_progress(self._name, progress)
+
+
+class JobRunner:
+    """Runs heavy controller analysis in the executor, never on the event loop,
+    with a limit on how many jobs run at the same time"""
+
+    def __init__(self, hass: HomeAssistant, max_jobs=DEFAULT_MAX_JOBS):
+        self._hass = hass
+        self._semaphore = asyncio.Semaphore(max_jobs)
+        self._jobs = {}
+
+    @property
+    def jobs(self) -> dict:
+        """Progress of the running and queued jobs"""
+        return {name: context.progress for name, context in self._jobs.items()}
+
+    async def async_run(self, name, target, *args, on_progress=None):
+        """Run target(context, *args) in the executor and return its result"""
+
+        if name in self._jobs:
+            raise HomeAssistantError(f"{name} is already running")
+
+        context = JobContext(self._hass, name, on_progress)
+        self._jobs[name] = context
+
+        try:
+            async with self._semaphore:
+                context.check_cancelled()
+                return await self._hass.async_add_executor_job(
+                    target, context, *args
+                )
+        except asyncio.CancelledError:
+            context.cancel()
+            raise
+        finally:
+            self._jobs.pop(name, None)
+
+    @callback
+    def async_cancel(self, name) -> bool:
+        """Cancel a running or queued job"""
+
+        context = self._jobs.get(name)
+        if context is None:
+            return False
+
+        _LOGGER.debug("%s job cancelled", name)
+        context.cancel()
+        return True
+
+
+def get_job_runner(hass: HomeAssistant) -> JobRunner:
+    """Returns the component job runner"""
+
+    data = hass.data.setdefault(COMPONENT_DOMAIN, {})
+    if DATA_JOB_RUNNER not in data:
+        data[DATA_JOB_RUNNER] = JobRunner(hass)
+
+    return data[DATA_JOB_RUNNER]
@@ -0,0 +1,209 @@
+#
+#  Copyright (c) 2022, Diogo Silva "Soloam"
+#  Creative Commons BY-NC-SA 4.0 International Public License
+#  (see LICENSE.md or https://creativecommons.org/licenses/by-nc-sa/4.0/)
+#
+"""
+PID Controller.
+For more details about this sensor, please refer to the documentation at
+https://github.com/soloam/ha-pid-controller/
+"""
+import logging
+from datetime import timedelta
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.event import async_track_time_interval
+
+# pylint: disable=wildcard-import, unused-wildcard-import
+from .const import *
+from .jobs import JobCancelled, get_job_runner
+from .oscillation import OSCILLATION_MIN_SAMPLES, detect_oscillations
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class OscillationMonitor:
+    """Periodically looks for oscillations on the error of all controllers,
+    analysed in one batch in the executor"""
+
+    def __init__(self, hass: HomeAssistant, interval=DEFAULT_OSCILLATION_INTERVAL):
+        self._hass = hass
+        self._interval = timedelta(seconds=interval)
+        self._controllers = []
+        self._unsub = None
+
+    @callback
+    def async_register(self, controller):
+        """Add a controller, returns the callback to remove it"""
+
+        self._controllers.append(controller)
+        if self._unsub is None:
+            self._unsub = async_track_time_interval(
+                self._hass, self._async_analyse, self._interval
+            )
+
+        @callback
+        def unregister():
+            self._controllers.remove(controller)
+            if not self._controllers and self._unsub is not None:
+                self._unsub()
+                self._unsub = None
+
+        return unregister
+
+    async def _async_analyse(self, now=None) -> None:
+        controllers = []
+        signals = []
+        for controller in self._controllers:
+            history = controller.error_history
+            if len(history) >= OSCILLATION_MIN_SAMPLES:
+                controllers.append(controller)
+                signals.append(history)
+
+        if not signals:
+            return
+
+        try:
+            results = await get_job_runner(self._hass).async_run(
+                JOB_OSCILLATION, detect_oscillations, signals
+            )
+        except (HomeAssistantError, JobCancelled) as ex:
+            _LOGGER.debug("oscillation analysis skipped: %s", ex)
+            return
+
+        for controller, result in zip(controllers, results):
+            if controller in self._controllers:
+                controller.async_set_oscillation(result)
+
+
+def get_oscillation_monitor(hass: HomeAssistant) -> OscillationMonitor:
+    """Returns the component oscillation monitor"""
+
+    data = hass.data.setdefault(COMPONENT_DOMAIN, {})
+    if DATA_OSCILLATION_MONITOR not in data:
+        data[DATA_OSCILLATION_MONITOR] = OscillationMonitor(hass)
+
+    return data[DATA_OSCILLATION_MONITOR]
+
+
+# pylint: disable=r0902
+class LoadMonitor:
+    """Measures the event loop lag, and while it is over the threshold
+    stretches the sample time of the lower priority controllers, low ones
+    first, normal ones from twice the threshold, high ones never"""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        threshold=DEFAULT_LAG_THRESHOLD,
+        max_stretch=DEFAULT_MAX_STRETCH,
+    ):
+        self._hass = hass
+        self._threshold = threshold
+        self._max_stretch = max_stretch
+        self._controllers = {}
+        self._handle = None
+        self._lag = 0.0
+        self._max_lag = 0.0
+        self._active = False
+        self._activations = 0
+
+    @property
+    def lag(self) -> float:
+        """Returns the smoothed loop lag, in seconds"""
+        return self._lag
+
+    @property
+    def max_lag(self) -> float:
+        """Returns the largest loop lag measured, in seconds"""
+        return self._max_lag
+
+    @property
+    def active(self) -> bool:
+        """Returns if controllers are being shed"""
+        return self._active
+
+    @property
+    def activations(self) -> int:
+        """Returns the times shedding started"""
+        return self._activations
+
+    @callback
+    def async_register(self, controller, priority=DEFAULT_PRIORITY):
+        """Add a controller, returns the callback to remove it"""
+
+        self._controllers[controller] = priority
+        if self._handle is None:
+            self._schedule(self._hass.loop.time())
+
+        @callback
+        def unregister():
+            self._controllers.pop(controller, None)
+            if not self._controllers and self._handle is not None:
+                self._handle.cancel()
+                self._handle = None
+
+        return unregister
+
+    def _schedule(self, now) -> None:
+        expected = now + LAG_PROBE_INTERVAL
+        self._handle = self._hass.loop.call_at(expected, self._probe, expected)
+
+    @callback
+    def _probe(self, expected) -> None:
+        now = self._hass.loop.time()
+        lag = max(now - expected, 0)
+        self._schedule(now)
+
+        # Rise at once, decay slowly, so shedding doesn't flap
+        self._lag = lag if lag > self._lag else 0.7 * self._lag + 0.3 * lag
+        self._max_lag = max(self._max_lag, lag)
+
+        active = self._lag > self._threshold
+        if active or self._active:
+            self._apply(active)
+
+    def _apply(self, active) -> None:
+        stretch = min(max(self._lag / self._threshold, 1), self._max_stretch)
+        stretches = {
+            PRIORITY_HIGH: 1,
+            PRIORITY_NORMAL: stretch if self._lag > 2 * self._threshold else 1,
+            PRIORITY_LOW: stretch,
+        }
+        if not active:
+            stretches = dict.fromkeys(stretches, 1)
+
+        shedding = 0
+        for controller, priority in self._controllers.items():
+            controller.async_set_stretch(stretches[priority])
+            shedding += stretches[priority] > 1
+
+        if active != self._active:
+            self._active = active
+            self._activations += active
+            _LOGGER.warning(
+                "event loop lag %.3fs, load shedding %s",
+                self._lag,
+                "started" if active else "stopped",
+            )
+            self._hass.bus.async_fire(
+                EVENT_LOAD_SHEDDING,
+                {
+                    ATTR_ACTIVE: active,
+                    ATTR_LAG: self._lag,
+                    ATTR_MAX_LAG: self._max_lag,
+                    ATTR_ACTIVATIONS: self._activations,
+                    ATTR_SHEDDING: shedding,
+                },
+            )
+
+
+def get_load_monitor(hass: HomeAssistant) -> LoadMonitor:
+    """Returns the component load monitor"""
+
+    data = hass.data.setdefault(COMPONENT_DOMAIN, {})
+    if DATA_LOAD_MONITOR not in data:
+        data[DATA_LOAD_MONITOR] = LoadMonitor(hass)
+
+    return data[DATA_LOAD_MONITOR]
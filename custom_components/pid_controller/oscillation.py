@@ -0,0 +1,93 @@
+#
+#  Copyright (c) 2022, Diogo Silva "Soloam"
+#  Creative Commons BY-NC-SA 4.0 International Public License
+#  (see LICENSE.md or https://creativecommons.org/licenses/by-nc-sa/4.0/)
+#
+"""
+PID Controller.
+For more details about this sensor, please refer to the documentation at
+https://github.com/soloam/ha-pid-controller/
+"""
+
+# Points each signal is resampled to, so a batch fits in one matrix
+OSCILLATION_POINTS = 256
+
+# Minimum samples in a signal to be analysed
+OSCILLATION_MIN_SAMPLES = 32
+
+
+def detect_oscillations(context, signals, min_cycles=3, min_power=0.5):
+    """Detects sustained oscillations on a batch of error signals.
+
+    Each signal, a list of (time, error), is resampled to the same number of
+    evenly spaced points, so the whole batch is analysed at once with one FFT
+    and one zero crossing count over a matrix. A signal oscillates if one
+    frequency, with at least min_cycles in the signal, holds min_power of
+    the signal power, and the zero crossings agree with that frequency.
+
+    Returns a dict with oscillating, period (seconds) and amplitude for each
+    signal.
+    """
+
+    count = len(signals)
+    if not count:
+        return []
+
+    # Imported here, in the executor, to keep numpy out of the import of
+    # the integration
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+
+    grid = np.arange(OSCILLATION_POINTS) / OSCILLATION_POINTS
+    spans = np.empty(count)
+    matrix = np.empty((count, OSCILLATION_POINTS))
+
+    for row, samples in enumerate(signals):
+        context.check_cancelled()
+
+        times, errors = np.asarray(samples, dtype=float).T
+        spans[row] = times[-1] - times[0]
+        matrix[row] = np.interp(times[0] + grid * spans[row], times, errors)
+
+    context.report_progress(0.5)
+
+    matrix -= matrix.mean(axis=1, keepdims=True)
+
+    spectrum = np.abs(np.fft.rfft(matrix, axis=1))
+    spectrum[:, 0] = 0
+    power = spectrum**2
+
+    rows = np.arange(count)
+    peak = power.argmax(axis=1)
+
+    # Leakage spreads a frequency over the neighbour bins
+    peak_power = (
+        power[rows, peak]
+        + power[rows, np.maximum(peak - 1, 1)] * (peak > 1)
+        + power[rows, np.minimum(peak + 1, power.shape[1] - 1)]
+        * (peak < power.shape[1] - 1)
+    )
+    total = power.sum(axis=1)
+    ratio = np.divide(peak_power, total, out=np.zeros(count), where=total > 0)
+
+    crossings = np.count_nonzero(np.diff(np.signbit(matrix), axis=1), axis=1)
+    period = np.divide(spans, peak, out=np.zeros(count), where=peak > 0)
+    amplitude = 2 * spectrum[rows, peak] / OSCILLATION_POINTS
+
+    oscillating = (
+        (peak >= min_cycles)
+        & (ratio >= min_power)
+        & (np.abs(crossings - 2 * peak) <= peak)
+        & (spans > 0)
+    )
+
+    context.report_progress(1)
+
+    return [
+        {
+            "oscillating": bool(oscillating[row]),
+            "period": float(period[row]),
+            "amplitude": float(amplitude[row]),
+        }
+        for row in rows
+    ]
@@ -0,0 +1,276 @@
+#
+#  Copyright (c) 2022, Diogo Silva "Soloam"
+#  Creative Commons BY-NC-SA 4.0 International Public License
+#  (see LICENSE.md or https://creativecommons.org/licenses/by-nc-sa/4.0/)
+#
+"""
+PID Controller.
+For more details about this sensor, please refer to the documentation at
+https://github.com/soloam/ha-pid-controller/
+"""
+import logging
+import time
+
+import voluptuous as vol
+from homeassistant.const import ATTR_ENTITY_ID, SERVICE_TURN_OFF, SERVICE_TURN_ON
+from homeassistant.core import HomeAssistant, callback, split_entity_id
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.event import async_call_later
+
+# pylint: disable=wildcard-import, unused-wildcard-import
+from .const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def output_service(entity_id, service=None, field=None):
+    """Returns the service and field that set the output entity, the
+    configured ones or the default ones for its domain"""
+
+    default_service, default_field = OUTPUT_SERVICES.get(
+        split_entity_id(entity_id)[0], (None, None)
+    )
+
+    return service or default_service, field or default_field
+
+
+# pylint: disable=r0902
+class OutputWriter:
+    """Writes the controller output to an actuator entity.
+
+    Only one call is in flight at a time, values that arrive meanwhile
+    replace the pending one, so a slow actuator only gets the latest value.
+    Values closer than delta to the last written one are dropped, and calls
+    are at least interval seconds apart.
+    """
+
+    # pylint: disable=r0913
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        entity_id,
+        service=None,
+        field=None,
+        delta=DEFAULT_OUTPUT_DELTA,
+        interval=DEFAULT_OUTPUT_INTERVAL,
+    ):
+        service, field = output_service(entity_id, service, field)
+
+        self._hass = hass
+        self._entity_id = entity_id
+        self._domain, self._service = service.split(".", 1)
+        self._field = field
+        self._delta = delta
+        self._interval = interval
+        self._pending = None
+        self._last_value = None
+        self._last_time = None
+        self._task = None
+        self._unsub_later = None
+        self._writes = 0
+        self._coalesced = 0
+
+    @property
+    def entity_id(self) -> str:
+        """Returns the output entity"""
+        return self._entity_id
+
+    @property
+    def writes(self) -> int:
+        """Returns the number of service calls made"""
+        return self._writes
+
+    @property
+    def coalesced(self) -> int:
+        """Returns the number of values replaced before being written"""
+        return self._coalesced
+
+    @callback
+    def async_write(self, value) -> None:
+        """Queue a value, replaces the pending one if any"""
+
+        if self._pending is not None:
+            self._coalesced += 1
+        self._pending = value
+
+        if self._task is None and self._unsub_later is None:
+            self._async_flush()
+
+    @callback
+    def async_cancel(self) -> None:
+        """Drop the pending value, an in flight call is left to finish"""
+
+        self._pending = None
+        if self._unsub_later is not None:
+            self._unsub_later()
+            self._unsub_later = None
+
+    # pylint: disable=unused-argument
+    @callback
+    def _async_flush(self, now=None) -> None:
+        self._unsub_later = None
+
+        value = self._pending
+        if value is None:
+            return
+
+        if (
+            self._last_value is not None
+            and abs(value - self._last_value) < self._delta
+        ):
+            self._pending = None
+            return
+
+        if self._last_time is not None:
+            wait = self._last_time + self._interval - time.monotonic()
+            if wait > 0:
+                self._unsub_later = async_call_later(
+                    self._hass, wait, self._async_flush
+                )
+                return
+
+        self._pending = None
+        self._task = self._hass.async_create_task(self._async_send(value))
+
+    async def _async_send(self, value) -> None:
+        try:
+            await self._hass.services.async_call(
+                self._domain,
+                self._service,
+                {ATTR_ENTITY_ID: self._entity_id, self._field: value},
+                blocking=True,
+            )
+            self._last_value = value
+            self._writes += 1
+        except (HomeAssistantError, vol.Invalid) as ex:
+            _LOGGER.warning(
+                "Error writing %s to %s: %s", value, self._entity_id, ex
+            )
+        finally:
+            self._last_time = time.monotonic()
+            self._task = None
+
+        self._async_flush()
+
+
+# pylint: disable=r0902
+class PwmWriter:
+    """Time proportioning output, switches an entity on for a duty fraction
+    of every cycle.
+
+    Edges are scheduled on the event loop monotonic clock, a new duty is
+    only picked up at the start of the next cycle. Pulses shorter than
+    min_on are skipped, and pauses shorter than min_off are filled.
+    """
+
+    # pylint: disable=r0913
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        entity_id,
+        cycle=DEFAULT_PWM_CYCLE,
+        min_on=DEFAULT_PWM_MIN_ON,
+        min_off=DEFAULT_PWM_MIN_OFF,
+    ):
+        self._hass = hass
+        self._entity_id = entity_id
+        self._cycle = cycle
+        self._min_on = min_on
+        self._min_off = min_off
+        self._duty = 0
+        self._cycle_duty = None
+        self._is_on = None
+        self._cycle_handle = None
+        self._edge_handle = None
+        self._jitter = None
+        self._max_jitter = None
+
+    @property
+    def entity_id(self) -> str:
+        """Returns the switched entity"""
+        return self._entity_id
+
+    @property
+    def duty(self) -> float | None:
+        """Returns the duty applied on the running cycle, between 0 and 1"""
+        return self._cycle_duty
+
+    @property
+    def jitter(self) -> float | None:
+        """Returns the delay in seconds of the last edge"""
+        return self._jitter
+
+    @property
+    def max_jitter(self) -> float | None:
+        """Returns the largest delay in seconds of an edge"""
+        return self._max_jitter
+
+    @callback
+    def async_set_duty(self, duty) -> None:
+        """Set the duty, between 0 and 1, for the next cycles"""
+        self._duty = max(min(duty, 1), 0)
+
+    @callback
+    def async_start(self) -> None:
+        """Start cycling from now"""
+
+        if self._cycle_handle is None:
+            self._async_cycle(self._hass.loop.time())
+
+    @callback
+    def async_stop(self) -> None:
+        """Stop cycling, the entity is left as is"""
+
+        for handle in (self._cycle_handle, self._edge_handle):
+            if handle is not None:
+                handle.cancel()
+        self._cycle_handle = None
+        self._edge_handle = None
+
+    @callback
+    def _async_cycle(self, start) -> None:
+        self._measure(start)
+
+        on_time = self._duty * self._cycle
+        if on_time < self._min_on:
+            on_time = 0
+        elif self._cycle - on_time < self._min_off:
+            on_time = self._cycle
+
+        self._cycle_duty = on_time / self._cycle
+        self._async_switch(on_time > 0)
+
+        loop = self._hass.loop
+        self._edge_handle = None
+        if 0 < on_time < self._cycle:
+            off = start + on_time
+            self._edge_handle = loop.call_at(off, self._async_edge_off, off)
+        end = start + self._cycle
+        self._cycle_handle = loop.call_at(end, self._async_cycle, end)
+
+    @callback
+    def _async_edge_off(self, scheduled) -> None:
+        self._edge_handle = None
+        self._measure(scheduled)
+        self._async_switch(False)
+
+    def _measure(self, scheduled) -> None:
+        if self._cycle_handle is None and self._edge_handle is None:
+            return
+
+        self._jitter = max(self._hass.loop.time() - scheduled, 0)
+        self._max_jitter = max(self._max_jitter or 0, self._jitter)
+
+    @callback
+    def _async_switch(self, is_on) -> None:
+        if is_on == self._is_on:
+            return
+
+        self._is_on = is_on
+        self._hass.async_create_task(
+            self._hass.services.async_call(
+                "homeassistant",
+                SERVICE_TURN_ON if is_on else SERVICE_TURN_OFF,
+                {ATTR_ENTITY_ID: self._entity_id},
+            )
+        )
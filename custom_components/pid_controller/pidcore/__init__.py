@@ -0,0 +1,21 @@
+#
+#  Copyright (c) 2022, Diogo Silva "Soloam"
+#  Creative Commons BY-NC-SA 4.0 International Public License
+#  (see LICENSE.md or https://creativecommons.org/licenses/by-nc-sa/4.0/)
+#
+"""
+PID Controller core, the control pipeline without Home Assistant.
+For more details about this sensor, please refer to the documentation at
+https://github.com/soloam/ha-pid-controller/
+"""
+
+from .pidcontroller import ControlMetrics, OnOffController, PIDController
+from .runtime import (
+    Controller,
+    ControllerCore,
+    ControllerRegistry,
+    MemorySink,
+    OutputSink,
+    Runtime,
+    make_rounder,
+)
@@ -0,0 +1,43 @@
+#
+#  Copyright (c) 2022, Diogo Silva "Soloam"
+#  Creative Commons BY-NC-SA 4.0 International Public License
+#  (see LICENSE.md or https://creativecommons.org/licenses/by-nc-sa/4.0/)
+#
+"""
+PID Controller.
+For more details about this sensor, please refer to the documentation at
+https://github.com/soloam/ha-pid-controller/
+"""
+
+# Default
+DEFAULT_PRECISION = 2
+DEFAULT_MINIMUM = 0
+DEFAULT_MAXIMUM = 1
+DEFAULT_ROUND = "round"
+DEFAULT_SAMPLE_TIME = 0
+DEFAULT_WINDUP = 20
+DEFAULT_FILTER_WINDOW = 1
+DEFAULT_SOURCE_DELTA = 0
+DEFAULT_AGGREGATION = "mean"
+DEFAULT_METRICS_WINDOW = 3600
+DEFAULT_MAX_INTERVAL = 600
+DEFAULT_SETPOINT_WEIGHT = 1
+DEFAULT_SETPOINT_RAMP = 0
+DEFAULT_OUTPUT_MIN = 0
+DEFAULT_OUTPUT_MAX = 100
+DEFAULT_ANTI_WINDUP = "freeze"
+DEFAULT_TRACKING_TIME = 0
+
+# Other
+ROUND_FLOOR = "floor"
+ROUND_CEIL = "ceil"
+ROUND_ROUND = "round"
+SHED_MIN_INTERVAL = 1
+
+# Headless runtime, readings queued and evaluated per scheduler batch
+RUNTIME_QUEUE_SIZE = 100000
+RUNTIME_BATCH_SIZE = 1000
+
+# State Snapshot
+ATTR_PID = "pid"
+ATTR_STATE = "state"
@@ -0,0 +1,317 @@
+#
+#  Copyright (c) 2022, Diogo Silva "Soloam"
+#  Creative Commons BY-NC-SA 4.0 International Public License
+#  (see LICENSE.md or https://creativecommons.org/licenses/by-nc-sa/4.0/)
+#
+"""
+PID Controller.
+For more details about this sensor, please refer to the documentation at
+https://github.com/soloam/ha-pid-controller/
+"""
+from collections import deque
+from heapq import heapify, heappop, heappush
+
+AGGREGATE_MEAN = "mean"
+AGGREGATE_MEDIAN = "median"
+AGGREGATE_MIN = "min"
+AGGREGATE_MAX = "max"
+AGGREGATE_WEIGHTED = "weighted"
+
+AGGREGATES = [
+    AGGREGATE_MEAN,
+    AGGREGATE_MEDIAN,
+    AGGREGATE_MIN,
+    AGGREGATE_MAX,
+    AGGREGATE_WEIGHTED,
+]
+
+# Running sums are recalculated after this many updates, to drop rounding drift
+RESYNC_UPDATES = 1024
+
+# Heaps are rebuilt once removed entries outnumber the live ones this many
+# times, entries removed below the top would otherwise never be dropped
+COMPACT_RATIO = 2
+
+
+class MedianHeap:
+    """Median of a collection of values, with O(log n) add and remove.
+
+    Lower half in a max heap, upper half in a min heap. Removed values are
+    only dropped from the heaps when they reach the top (lazy deletion), or
+    when the heaps are compacted.
+    """
+
+    def __init__(self):
+        self._low = []
+        self._high = []
+        self._low_size = 0
+        self._high_size = 0
+        self._delayed = {}
+
+    def __len__(self) -> int:
+        return self._low_size + self._high_size
+
+    def add(self, value) -> None:
+        if not self._low or value <= -self._low[0]:
+            heappush(self._low, -value)
+            self._low_size += 1
+        else:
+            heappush(self._high, value)
+            self._high_size += 1
+
+        self._balance()
+
+    def remove(self, value) -> None:
+        """Remove a value, it must have been added before"""
+
+        self._delayed[value] = self._delayed.get(value, 0) + 1
+
+        if value <= -self._low[0]:
+            self._low_size -= 1
+            if value == -self._low[0]:
+                self._prune(self._low, -1)
+        else:
+            self._high_size -= 1
+            if value == self._high[0]:
+                self._prune(self._high, 1)
+
+        self._balance()
+
+        size = self._low_size + self._high_size
+        if len(self._low) + len(self._high) - size > COMPACT_RATIO * size:
+            self._compact()
+
+    def clear(self) -> None:
+        self.__init__()
+
+    @property
+    def median(self) -> float | None:
+        if not self._low_size:
+            return None
+
+        if self._low_size > self._high_size:
+            return -self._low[0]
+
+        return (-self._low[0] + self._high[0]) / 2
+
+    def _prune(self, heap, sign) -> None:
+        while heap:
+            value = sign * heap[0]
+            count = self._delayed.get(value)
+            if not count:
+                return
+
+            if count == 1:
+                del self._delayed[value]
+            else:
+                self._delayed[value] = count - 1
+
+            heappop(heap)
+
+    def _compact(self) -> None:
+        """Drop the removed entries and split the live values again"""
+
+        delayed = self._delayed
+        values = []
+        for value in [-key for key in self._low] + self._high:
+            count = delayed.get(value)
+            if count:
+                delayed[value] = count - 1
+            else:
+                values.append(value)
+
+        values.sort()
+        middle = (len(values) + 1) // 2
+        self._low = [-value for value in reversed(values[:middle])]
+        self._high = values[middle:]
+        self._low_size = len(self._low)
+        self._high_size = len(self._high)
+        self._delayed = {}
+
+    def _balance(self) -> None:
+        if self._low_size > self._high_size + 1:
+            heappush(self._high, -heappop(self._low))
+            self._low_size -= 1
+            self._high_size += 1
+            self._prune(self._low, -1)
+        elif self._low_size < self._high_size:
+            heappush(self._low, -heappop(self._high))
+            self._high_size -= 1
+            self._low_size += 1
+            self._prune(self._high, 1)
+
+
+class SlidingMedian:
+    """Median of the last window values, rejects spikes shorter than half
+    the window"""
+
+    def __init__(self, window):
+        self._window = window
+        self._values = deque()
+        self._heap = MedianHeap()
+
+    @property
+    def window(self) -> int:
+        return self._window
+
+    @property
+    def median(self) -> float | None:
+        return self._heap.median
+
+    def update(self, value) -> float:
+        """Add a value and return the median of the window"""
+
+        self._values.append(value)
+        self._heap.add(value)
+
+        while len(self._values) > self._window:
+            self._heap.remove(self._values.popleft())
+
+        return self._heap.median
+
+    def reset(self) -> None:
+        self._values.clear()
+        self._heap.clear()
+
+
+class ExtremeHeap:
+    """Minimum (or maximum) of a collection of values, with O(log n) add and
+    remove (lazy deletion, compacted when removed entries pile up)"""
+
+    def __init__(self, maximum=False):
+        self._sign = -1 if maximum else 1
+        self._heap = []
+        self._size = 0
+        self._delayed = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, value) -> None:
+        heappush(self._heap, self._sign * value)
+        self._size += 1
+
+    def remove(self, value) -> None:
+        """Remove a value, it must have been added before"""
+
+        key = self._sign * value
+        self._delayed[key] = self._delayed.get(key, 0) + 1
+        self._size -= 1
+        self._prune()
+
+        if len(self._heap) - self._size > COMPACT_RATIO * self._size:
+            self._compact()
+
+    @property
+    def top(self) -> float | None:
+        if not self._heap:
+            return None
+        return self._sign * self._heap[0]
+
+    def _prune(self) -> None:
+        while self._heap:
+            key = self._heap[0]
+            count = self._delayed.get(key)
+            if not count:
+                return
+
+            if count == 1:
+                del self._delayed[key]
+            else:
+                self._delayed[key] = count - 1
+
+            heappop(self._heap)
+
+    def _compact(self) -> None:
+        """Drop the removed entries and rebuild the heap"""
+
+        delayed = self._delayed
+        heap = []
+        for key in self._heap:
+            count = delayed.get(key)
+            if count:
+                delayed[key] = count - 1
+            else:
+                heap.append(key)
+
+        heapify(heap)
+        self._heap = heap
+        self._delayed = {}
+
+
+class SourceAggregate:
+    """Aggregate of several sources, updated one member at a time.
+
+    Mean and weighted mean keep running sums, O(1) per update, median, min
+    and max keep heaps, O(log n) per update.
+    """
+
+    def __init__(self, method=AGGREGATE_MEAN, weights=None):
+        self._method = method
+        self._weights = weights or {}
+        self._values = {}
+        self._sum = 0.0
+        self._weight = 0.0
+        self._updates = 0
+
+        self._heap = None
+        if method == AGGREGATE_MEDIAN:
+            self._heap = MedianHeap()
+        elif method in (AGGREGATE_MIN, AGGREGATE_MAX):
+            self._heap = ExtremeHeap(maximum=method == AGGREGATE_MAX)
+
+    def weight(self, member) -> float:
+        if self._method != AGGREGATE_WEIGHTED:
+            return 1.0
+        return self._weights.get(member, 1.0)
+
+    def update(self, member, value) -> float | None:
+        """Set the value of a member, None removes it, and returns the
+        aggregate"""
+
+        old = self._values.pop(member, None)
+        if old is not None:
+            if self._heap is not None:
+                self._heap.remove(old)
+            else:
+                weight = self.weight(member)
+                self._sum -= old * weight
+                self._weight -= weight
+
+        if value is not None:
+            self._values[member] = value
+            if self._heap is not None:
+                self._heap.add(value)
+            else:
+                weight = self.weight(member)
+                self._sum += value * weight
+                self._weight += weight
+
+        self._updates += 1
+        if self._heap is None and self._updates >= RESYNC_UPDATES:
+            self._resync()
+
+        return self.value
+
+    @property
+    def value(self) -> float | None:
+        if not self._values:
+            return None
+
+        if self._method == AGGREGATE_MEDIAN:
+            return self._heap.median
+
+        if self._heap is not None:
+            return self._heap.top
+
+        if not self._weight:
+            return None
+
+        return self._sum / self._weight
+
+    def _resync(self) -> None:
+        self._updates = 0
+        self._sum = sum(
+            value * self.weight(member) for member, value in self._values.items()
+        )
+        self._weight = sum(self.weight(member) for member in self._values)
@@ -0,0 +1,595 @@
+#
+#  Copyright (c) 2022, Diogo Silva "Soloam"
+#  Creative Commons BY-NC-SA 4.0 International Public License
+#  (see LICENSE.md or https://creativecommons.org/licenses/by-nc-sa/4.0/)
+#
+"""
+PID Controller.
+For more details about this sensor, please refer to the documentation at
+https://github.com/soloam/ha-pid-controller/
+"""
+import time
+from collections import deque
+from math import exp, sqrt
+
+# pylint: disable=invalid-name
+
+
+class ControlMetrics:
+    """Control quality metrics, updated in O(1) on each PID update.
+
+    Integrals forget old samples exponentially over window seconds, so no
+    sample history is kept. Overshoot and settling time are measured from
+    the last set point change.
+    """
+
+    SETTLING_BAND = 0.02
+
+    def __init__(self, window=3600):
+        self.window = window
+
+        self.iae = 0.0
+        self.ise = 0.0
+        self.itae = 0.0
+        self.travel = 0.0
+        self.overshoot = 0.0
+        self.settling_time = None
+
+        self._step = None
+        self._change_time = None
+        self._last_outside = None
+        self._last_output = None
+
+    def set_point_changed(self):
+        """Start measuring a new step, from the next sample"""
+        self._step = None
+        self._change_time = None
+        self._last_outside = None
+        self.overshoot = 0.0
+        self.settling_time = None
+
+    def update(self, error, output, delta_time, current_time):
+        if self._change_time is None:
+            self._step = error
+            self._change_time = current_time
+            self._last_outside = current_time
+
+        decay = exp(-delta_time / self.window) if self.window else 1.0
+        abs_error = abs(error)
+        elapsed = current_time - self._change_time
+
+        # Integral of absolute, squared and time weighted absolute error
+        self.iae = self.iae * decay + abs_error * delta_time
+        self.ise = self.ise * decay + error * error * delta_time
+        self.itae = self.itae * decay + elapsed * abs_error * delta_time
+
+        # Actuator travel, total variation of the output
+        if self._last_output is not None:
+            self.travel = self.travel * decay + abs(output - self._last_output)
+        self._last_output = output
+
+        # Overshoot, how far the feedback went past the set point
+        if self._step:
+            self.overshoot = max(self.overshoot, -error if self._step > 0 else error)
+
+        # Settling time, since the change until the error last left the band
+        if abs_error > abs(self._step) * self.SETTLING_BAND:
+            self._last_outside = current_time
+            self.settling_time = None
+        else:
+            self.settling_time = self._last_outside - self._change_time
+
+
+class PIDController:
+    """PID Controller"""
+
+    WARMUP_STAGE = 3
+    HISTORY_SIZE = 256
+
+    # Anti windup, freeze stops integrating while the output is at a limit,
+    # conditional only while the error pushes it further, back calculation
+    # unwinds the integral by the saturation over a tracking time
+    ANTI_WINDUP_FREEZE = "freeze"
+    ANTI_WINDUP_CONDITIONAL = "conditional"
+    ANTI_WINDUP_BACK_CALCULATION = "back_calculation"
+    ANTI_WINDUP_MODES = [
+        ANTI_WINDUP_FREEZE,
+        ANTI_WINDUP_CONDITIONAL,
+        ANTI_WINDUP_BACK_CALCULATION,
+    ]
+
+    # Snapshot keys and the attributes they hold, the optional ones are
+    # None until the first update. The sample times are exported but not
+    # restored
+    SNAPSHOT_FIELDS = {
+        "kp": "_kp",
+        "ki": "_ki",
+        "kd": "_kd",
+        "set_point": "_set_point_target",
+        "effective_set_point": "_set_point",
+        "p": "_p_term",
+        "i": "_i_term",
+        "d": "_d_term",
+        "output": "_output",
+        "last_output": "_last_output",
+        "last_input": "_last_input",
+        "last_time": "_last_time",
+        "skipped_time": "_skipped_time",
+    }
+    SNAPSHOT_OPTIONAL = {"last_output", "last_input", "last_time", "skipped_time"}
+
+    # pylint: disable=r0913
+    def __init__(
+        self,
+        P=0.2,
+        I=0.0,
+        D=0.0,
+        logger=None,
+        metrics_window=3600,
+        setpoint_weight=1.0,
+        setpoint_ramp=0.0,
+        output_limits=(0, 100),
+        anti_windup=ANTI_WINDUP_FREEZE,
+        tracking_time=0.0,
+    ):
+        self._logger = logger
+        self._metrics = ControlMetrics(metrics_window)
+        self._history = deque(maxlen=self.HISTORY_SIZE)
+
+        self._set_point = 0
+        self._set_point_target = 0
+        self._setpoint_weight = setpoint_weight
+        self._setpoint_ramp = setpoint_ramp
+        self._output_limits = output_limits
+        self._anti_windup = anti_windup
+        self._tracking_time = tracking_time
+        self._windup = (None, None)
+        self._output = 0.0
+
+        self._kp = P
+        self._ki = I
+        self._kd = D
+
+        self._p_term = 0.0
+        self._i_term = 0.0
+        self._d_term = 0.0
+
+        self._sample_time = None
+        self._last_output = None
+        self._last_input = None
+        self._last_time = None
+
+        self._skipped_time = None
+
+        self.reset_pid()
+
+    def reset_pid(self):
+        self._p_term = 0.0
+        self._i_term = 0.0
+        self._d_term = 0.0
+
+        self._sample_time = None
+        self._last_output = None
+        self._last_input = None
+        self._last_time = None
+
+        self._skipped_time = None
+
+        self._set_point = self._set_point_target
+
+    def snapshot(self):
+        """Gains, set point, terms and last sample, as a plain dict"""
+        return {key: getattr(self, attr) for key, attr in self.SNAPSHOT_FIELDS.items()}
+
+    def restore(self, snapshot):
+        """Restore a snapshot, raises KeyError, TypeError or ValueError on
+        an invalid one, before changing anything"""
+
+        values = {}
+        for key, attr in self.SNAPSHOT_FIELDS.items():
+            value = snapshot[key]
+            if value is not None or key not in self.SNAPSHOT_OPTIONAL:
+                value = float(value)
+            values[attr] = value
+
+        for attr, value in values.items():
+            setattr(self, attr, value)
+
+        # Sample times are wall clock, the gap since the export must not be
+        # integrated, the first sample after a restore is a new baseline
+        self._last_time = None
+        self._skipped_time = None
+        self._history.clear()
+
+    @classmethod
+    def check_snapshot(cls, snapshot):
+        """Raises KeyError, TypeError or ValueError on an invalid snapshot"""
+        cls().restore(snapshot)
+
+    def skip(self, feedback_value, in_time=None):
+        """Integrates a feedback value that is not evaluated, the output
+        holds until the next update"""
+
+        if self._last_time is None:
+            return
+
+        current_time = in_time if in_time is not None else self.current_time()
+        last_time = (
+            self._skipped_time if self._skipped_time is not None else self._last_time
+        )
+
+        delta_time = current_time - last_time
+        if delta_time <= 0:
+            return
+
+        error = self._set_point - feedback_value
+        if self._integrate(error):
+            self._i_term += self._ki * error * delta_time
+            self._i_term = self.clamp_value(self._i_term, self._windup)
+
+        self._skipped_time = current_time
+
+    def update(self, feedback_value, in_time=None):
+        """Calculates PID value for given reference feedback"""
+
+        current_time = in_time if in_time is not None else self.current_time()
+        if self._last_time is None:
+            self._last_time = current_time
+
+            # Restored, the terms hold until the next sample
+            if self._last_input is not None:
+                self._last_input = feedback_value
+                return self._output
+
+        # Fill PID information
+        delta_time = current_time - self._last_time
+        if not delta_time:
+            delta_time = 1e-16
+        elif delta_time < 0:
+            return
+
+        # Return last output if sample time not met
+        if (
+            self._sample_time is not None
+            and self._last_output is not None
+            and delta_time < self._sample_time
+        ):
+            return self._last_output
+
+        # Move the set point towards its target
+        if self._set_point != self._set_point_target:
+            self._ramp_set_point(delta_time)
+
+        # Calculate error
+        error = self._set_point - feedback_value
+        last_error = self._set_point - (
+            self._last_input if self._last_input is not None else self._set_point
+        )
+
+        # Calculate delta error
+        delta_error = error - last_error
+
+        # Calculate P, with the set point weighted
+        if self._setpoint_weight == 1:
+            self._p_term = self._kp * error
+        else:
+            self._p_term = self._kp * (
+                self._setpoint_weight * self._set_point - feedback_value
+            )
+
+        # Calculate I and avoids Sturation
+        # Skipped samples are integrated up to the last one
+        if self._integrate(error):
+            integral_time = delta_time
+            if self._skipped_time is not None:
+                integral_time = current_time - self._skipped_time
+            self._i_term += self._ki * error * integral_time
+            self._i_term = self.clamp_value(self._i_term, self._windup)
+
+        # Calculate D
+        self._d_term = self._kd * delta_error / delta_time
+
+        # Compute final output
+        output = self._p_term + self._i_term + self._d_term
+        self._output = self.clamp_value(output, self._output_limits)
+
+        if (
+            self._anti_windup == self.ANTI_WINDUP_BACK_CALCULATION
+            and self._output != output
+        ):
+            self._i_term += (self._output - output) * min(
+                delta_time / self.effective_tracking_time, 1
+            )
+
+        self._metrics.update(error, self._output, delta_time, current_time)
+        self._history.append((current_time, error))
+
+        # Keep Track
+        self._last_output = self._output
+        self._last_input = feedback_value
+        self._last_time = current_time
+        self._skipped_time = None
+
+    @property
+    def kp(self):
+        """Aggressively the PID reacts to the current error with setting Proportional Gain"""
+        return self._kp
+
+    @kp.setter
+    def kp(self, value):
+        self._kp = value
+
+    @property
+    def ki(self):
+        """Aggressively the PID reacts to the current error with setting Integral Gain"""
+        return self._ki
+
+    @ki.setter
+    def ki(self, value):
+        self._ki = value
+
+    @property
+    def kd(self):
+        """Determines how aggressively the PID reacts to the current
+        error with setting Derivative Gain"""
+        return self._kd
+
+    @kd.setter
+    def kd(self, value):
+        self._kd = value
+
+    @property
+    def set_point(self):
+        """The target point to the PID"""
+        return self._set_point_target
+
+    @set_point.setter
+    def set_point(self, value):
+        if value != self._set_point_target:
+            self._metrics.set_point_changed()
+            self._history.clear()
+        self._set_point_target = value
+
+        # Ramps only from a running PID, a fresh one starts on the target
+        if not self._setpoint_ramp or self._last_time is None:
+            self._set_point = value
+
+    def _integrate(self, error):
+        """If the integral may grow on this sample"""
+
+        if self._last_output is None:
+            return True
+
+        lower, upper = self._output_limits
+
+        if self._anti_windup == self.ANTI_WINDUP_BACK_CALCULATION:
+            return True
+
+        if self._anti_windup == self.ANTI_WINDUP_CONDITIONAL:
+            growth = self._ki * error
+            return not (
+                (self._last_output >= upper and growth > 0)
+                or (self._last_output <= lower and growth < 0)
+            )
+
+        return lower < self._last_output < upper
+
+    @property
+    def output_limits(self):
+        """Lower and upper limit of the output"""
+        return self._output_limits
+
+    @output_limits.setter
+    def output_limits(self, value):
+        self._output_limits = value
+
+    @property
+    def anti_windup(self):
+        """Anti windup mode, one of ANTI_WINDUP_MODES"""
+        return self._anti_windup
+
+    @anti_windup.setter
+    def anti_windup(self, value):
+        self._anti_windup = value
+
+    @property
+    def tracking_time(self):
+        """Back calculation tracking time, 0 derives it from the gains"""
+        return self._tracking_time
+
+    @tracking_time.setter
+    def tracking_time(self, value):
+        self._tracking_time = value
+
+    @property
+    def effective_tracking_time(self):
+        """Tracking time in use, the configured one or the integral time
+        (sqrt(Ti * Td) with a derivative), 1 second without both p and i"""
+
+        if self._tracking_time:
+            return self._tracking_time
+
+        if not self._kp or not self._ki:
+            return 1.0
+
+        integral_time = abs(self._kp / self._ki)
+        if not self._kd:
+            return integral_time
+
+        return sqrt(integral_time * abs(self._kd / self._kp))
+
+    @property
+    def effective_set_point(self):
+        """The set point in use, moving towards the target when ramping"""
+        return self._set_point
+
+    @property
+    def setpoint_weight(self):
+        """Fraction of the set point seen by the proportional term, below 1
+        a set point change kicks the output less, the integral still
+        brings the error to zero"""
+        return self._setpoint_weight
+
+    @setpoint_weight.setter
+    def setpoint_weight(self, value):
+        self._setpoint_weight = value
+
+    @property
+    def setpoint_ramp(self):
+        """Maximum set point change per second, 0 applies changes at once"""
+        return self._setpoint_ramp
+
+    @setpoint_ramp.setter
+    def setpoint_ramp(self, value):
+        self._setpoint_ramp = value
+        if not value:
+            self._set_point = self._set_point_target
+
+    def _ramp_set_point(self, delta_time):
+        step = self._setpoint_ramp * delta_time
+        if self._set_point < self._set_point_target:
+            self._set_point = min(self._set_point + step, self._set_point_target)
+        else:
+            self._set_point = max(self._set_point - step, self._set_point_target)
+
+    @property
+    def windup(self):
+        """Integral windup, also known as integrator windup or reset windup,
+        refers to the situation in a PID feedback controller where
+        a large change in setpoint occurs (say a positive change)
+        and the integral terms accumulates a significant error
+        during the rise (windup), thus overshooting and continuing
+        to increase as this accumulated error is unwound
+        (offset by errors in the other direction).
+        The specific problem is the excess overshooting.
+        """
+        return self._windup
+
+    @windup.setter
+    def windup(self, value):
+        self._windup = (-value, value)
+
+    @property
+    def sample_time(self):
+        """PID that should be updated at a regular interval.
+        Based on a pre-determined sampe time, the PID decides if it should compute or
+        return immediately.
+        """
+        return self._sample_time
+
+    @sample_time.setter
+    def sample_time(self, value):
+        self._sample_time = value
+
+    @property
+    def p(self):
+        return self._p_term
+
+    @property
+    def i(self):
+        return self._i_term
+
+    @property
+    def d(self):
+        return self._d_term
+
+    @property
+    def output(self):
+        """PID result"""
+        return self._output
+
+    @property
+    def last_time(self):
+        """Time of the last computed sample, None before the first one"""
+        return self._last_time
+
+    @property
+    def metrics(self):
+        """Control quality metrics"""
+        return self._metrics
+
+    @property
+    def history(self):
+        """Last (time, error) samples, since the set point changed"""
+        return list(self._history)
+
+    def log(self, message):
+        if not self._logger:
+            return
+        self._logger.warning(message)
+
+    def current_time(self):
+        try:
+            ret_time = time.monotonic()
+        except AttributeError:
+            ret_time = time.time()
+
+        return ret_time
+
+    def clamp_value(self, value, limits):
+        lower, upper = limits
+
+        if value is None:
+            return None
+        elif not lower and not upper:
+            return value
+        elif (upper is not None) and (value > upper):
+            return upper
+        elif (lower is not None) and (value < lower):
+            return lower
+        return value
+
+
+class OnOffController:
+    """On/Off Controller, with an hysteresis band around the set point and
+    minimum on and off times"""
+
+    def __init__(self, hysteresis=0.0, min_on_time=0.0, min_off_time=0.0):
+        self.hysteresis = hysteresis
+        self.min_on_time = min_on_time
+        self.min_off_time = min_off_time
+
+        self._is_on = None
+        self._last_switch = None
+        self._switch_count = 0
+
+    def reset(self):
+        """Forget the state, the next update decides freely"""
+        self._is_on = None
+        self._last_switch = None
+
+    def update(self, feedback_value, set_point, in_time=None):
+        """Returns True while the output must be on, switches on below the
+        band and off above it, holds while inside it or dwelling"""
+
+        current_time = in_time if in_time is not None else time.monotonic()
+        half_band = self.hysteresis / 2
+
+        if self._is_on is None:
+            self._is_on = feedback_value < set_point
+            self._last_switch = current_time
+            return self._is_on
+
+        if self._is_on:
+            switch = feedback_value >= set_point + half_band
+            dwell = self.min_on_time
+        else:
+            switch = feedback_value < set_point - half_band
+            dwell = self.min_off_time
+
+        if switch and current_time - self._last_switch >= dwell:
+            self._is_on = not self._is_on
+            self._last_switch = current_time
+            self._switch_count += 1
+
+        return self._is_on
+
+    @property
+    def is_on(self):
+        """Output state, None before the first update"""
+        return self._is_on
+
+    @property
+    def switch_count(self):
+        """Number of times the output switched"""
+        return self._switch_count
@@ -0,0 +1,677 @@
+#
+#  Copyright (c) 2022, Diogo Silva "Soloam"
+#  Creative Commons BY-NC-SA 4.0 International Public License
+#  (see LICENSE.md or https://creativecommons.org/licenses/by-nc-sa/4.0/)
+#
+"""
+PID Controller.
+For more details about this sensor, please refer to the documentation at
+https://github.com/soloam/ha-pid-controller/
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from math import ceil, floor
+
+# pylint: disable=wildcard-import, unused-wildcard-import
+from .const import *
+from .filters import SlidingMedian, SourceAggregate
+from .pidcontroller import OnOffController, PIDController
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def make_rounder(round_type, precision):
+    """Build the rounding function for a round type and precision"""
+
+    factor = pow(10, precision)
+
+    if round_type == ROUND_FLOOR:
+        rounder = lambda value: floor(value * factor) / factor
+    elif round_type == ROUND_CEIL:
+        rounder = lambda value: ceil(value * factor) / factor
+    else:
+        rounder = lambda value: round(value, precision)
+
+    if precision == 0:
+        return lambda value: int(rounder(value))
+
+    return rounder
+
+
+# pylint: disable=r0902
+class ControllerCore:
+    """The control pipeline of one controller, without Home Assistant.
+
+    Source readings are aggregated and filtered, gated (stale samples,
+    sample time, load shedding and send on delta) and fed to the PID, or to
+    the On/Off controller while all gains are zero. The state is the raw
+    output, between 0 and 100. The caller owns the parameters, they are
+    passed on every evaluation.
+    """
+
+    # pylint: disable=r0913
+    def __init__(
+        self,
+        sources,
+        filter_window=DEFAULT_FILTER_WINDOW,
+        source_delta=DEFAULT_SOURCE_DELTA,
+        max_interval=DEFAULT_MAX_INTERVAL,
+        aggregation=DEFAULT_AGGREGATION,
+        weights=None,
+        metrics_window=DEFAULT_METRICS_WINDOW,
+        on_off=None,
+        reset_on_set_point=True,
+        setpoint_weight=DEFAULT_SETPOINT_WEIGHT,
+        setpoint_ramp=DEFAULT_SETPOINT_RAMP,
+        output_limits=(DEFAULT_OUTPUT_MIN, DEFAULT_OUTPUT_MAX),
+        anti_windup=DEFAULT_ANTI_WINDUP,
+        tracking_time=DEFAULT_TRACKING_TIME,
+        logger=None,
+    ):
+        self._sources = list(sources)
+        self._source_aggregate = SourceAggregate(aggregation, weights)
+        self._source_filter = (
+            SlidingMedian(filter_window) if filter_window > 1 else None
+        )
+        self._filtered_source = None
+        self._source_delta = source_delta
+        self._max_interval = max_interval
+        self._metrics_window = metrics_window
+        self._on_off = on_off or OnOffController()
+        self._reset_on_set_point = reset_on_set_point
+        self._setpoint_weight = setpoint_weight
+        self._setpoint_ramp = setpoint_ramp
+        self._output_limits = output_limits
+        self._anti_windup = anti_windup
+        self._tracking_time = tracking_time
+        self._logger = logger or _LOGGER
+
+        self._pid = None
+        self._state = 0
+        self._last_evaluation = None
+        self._source_times = {}
+        self._evaluated = 0
+        self._skipped = 0
+        self._duplicates = 0
+        self._out_of_order = 0
+        self._stretch = 1
+        self._shed = 0
+        self._shed_sample = None
+
+    @property
+    def sources(self) -> list:
+        """Returns the source entities"""
+        return self._sources
+
+    @property
+    def pid(self) -> PIDController | None:
+        """Returns the PID, None until the first evaluation with gains"""
+        return self._pid
+
+    @property
+    def on_off(self) -> OnOffController:
+        """Returns the On/Off controller, used while all gains are zero"""
+        return self._on_off
+
+    @property
+    def state(self) -> float:
+        """Returns the raw output, between 0 and 100"""
+        return self._state
+
+    @state.setter
+    def state(self, value):
+        self._state = value
+
+    @property
+    def source(self) -> float | None:
+        """Returns the sources aggregated, None if none is a number"""
+        return self._source_aggregate.value
+
+    @property
+    def filtered_source(self) -> float | None:
+        """Returns the source after filtering, as seen by the PID"""
+        return self._filtered_source
+
+    @property
+    def evaluated(self) -> int:
+        """Returns the number of source readings evaluated by the PID"""
+        return self._evaluated
+
+    @property
+    def skipped(self) -> int:
+        """Returns the number of source readings skipped by send on delta"""
+        return self._skipped
+
+    @property
+    def duplicates(self) -> int:
+        """Returns the number of source samples dropped as repeated"""
+        return self._duplicates
+
+    @property
+    def out_of_order(self) -> int:
+        """Returns the number of source samples dropped as older than the
+        last one evaluated"""
+        return self._out_of_order
+
+    @property
+    def stretch(self) -> float:
+        """Returns how much the sample time is stretched by load shedding"""
+        return self._stretch
+
+    @stretch.setter
+    def stretch(self, value):
+        self._stretch = value
+
+    @property
+    def shed(self) -> int:
+        """Returns the number of source samples shed under loop lag"""
+        return self._shed
+
+    def create_pid(self, p_base, i_base, d_base) -> PIDController:
+        """Returns a new PID with the settings of the controller"""
+        return PIDController(
+            p_base,
+            i_base,
+            d_base,
+            logger=self._logger,
+            metrics_window=self._metrics_window,
+            setpoint_weight=self._setpoint_weight,
+            setpoint_ramp=self._setpoint_ramp,
+            output_limits=self._output_limits,
+            anti_windup=self._anti_windup,
+            tracking_time=self._tracking_time,
+        )
+
+    def reset(self) -> None:
+        """Reset the PID terms and the On/Off state and dwell, the next
+        sample is evaluated"""
+        self.reset_pid()
+        self._on_off.reset()
+
+    def reset_pid(self) -> None:
+        """Reset the PID terms only, the On/Off dwell holds, the next sample
+        is evaluated"""
+        if self._pid:
+            self._pid.reset_pid()
+        self._last_evaluation = None
+
+    def invalidate(self) -> None:
+        """Forget the last evaluation, the next sample is evaluated"""
+        self._last_evaluation = None
+
+    def snapshot(self) -> dict:
+        """Returns the PID and output state, to restore with restore"""
+        return {
+            ATTR_PID: self._pid.snapshot() if self._pid is not None else None,
+            ATTR_STATE: self._state,
+        }
+
+    @staticmethod
+    def check_snapshot(snapshot) -> None:
+        """Raises KeyError, TypeError or ValueError on an invalid state"""
+
+        float(snapshot[ATTR_STATE])
+        if snapshot[ATTR_PID] is not None:
+            PIDController.check_snapshot(snapshot[ATTR_PID])
+
+    def restore(self, snapshot) -> None:
+        """Restore a state from snapshot, checked with check_snapshot"""
+
+        if snapshot[ATTR_PID] is not None:
+            if self._pid is None:
+                self._pid = self.create_pid(0, 0, 0)
+            self._pid.restore(snapshot[ATTR_PID])
+
+        self._state = float(snapshot[ATTR_STATE])
+        self._last_evaluation = None
+
+    def load(self, entity, value) -> None:
+        """Set the reading of a source without evaluating it"""
+        self._source_aggregate.update(entity, value)
+
+    def accept(self, entity, value, timestamp, fast_path=True) -> float | None:
+        """Condition and gate a source reading, value None when it isn't a
+        number. Returns the source to evaluate, None when it's dropped"""
+
+        if self._stale_source(entity, timestamp):
+            return None
+
+        source = self._condition_source(entity, value)
+        if source is None:
+            return None
+
+        if fast_path and self._within_sample_time(source, timestamp):
+            return None
+
+        if self._skip_source(source, timestamp):
+            return None
+
+        return source
+
+    def release_shed(self) -> tuple | None:
+        """Returns the last sample shed as (source, timestamp) once shedding
+        ended, None if there is none or send on delta skips it"""
+
+        if self._stretch > 1 or self._shed_sample is None:
+            return None
+
+        (source, timestamp), self._shed_sample = self._shed_sample, None
+        if self._skip_source(source, timestamp):
+            return None
+
+        return source, timestamp
+
+    def switch(self, source, set_point, invert, timestamp) -> bool:
+        """Evaluate the On/Off controller, source None only refreshes.
+        Returns if the state changed"""
+
+        self._last_evaluation = None
+        if source is None:
+            return False
+
+        self._shed_sample = None
+        state = 100 if self._on_off.update(source, set_point, timestamp) else 0
+        if invert:
+            state = 100 - state
+
+        return self._set_state(state)
+
+    def configure(self, set_point, gains, sample_time, windup) -> None:
+        """Apply the parameters to the PID before gating a sample, a gains
+        change or a set point reset lets the next sample through"""
+
+        p_base, i_base, d_base = gains
+
+        if self._pid is None:
+            self._pid = self.create_pid(p_base, i_base, d_base)
+        elif (
+            p_base != self._pid.kp
+            or i_base != self._pid.ki
+            or d_base != self._pid.kd
+        ):
+            self._pid.kp = p_base
+            self._pid.ki = i_base
+            self._pid.kd = d_base
+            self._last_evaluation = None
+
+        # The reset clears the sample time, apply it first
+        if set_point != self._pid.set_point:
+            if self._reset_on_set_point:
+                self.reset_pid()
+            self._pid.set_point = set_point
+
+        if sample_time != self._pid.sample_time:
+            self._pid.sample_time = sample_time
+
+        if windup != self._pid.windup:
+            self._pid.windup = windup
+
+    # pylint: disable=r0913
+    def evaluate(
+        self, source, set_point, gains, sample_time, windup, timestamp
+    ) -> bool:
+        """Evaluate the PID with the signed gains, source None only applies
+        the parameters. Returns if the state changed"""
+
+        self.configure(set_point, gains, sample_time, windup)
+
+        if source is not None:
+            self._pid.update(source, in_time=timestamp)
+            # A sample inside the sample time is discarded by the PID, only
+            # computed ones gate the next samples
+            if self._pid.last_time == timestamp:
+                self._last_evaluation = (source, set_point, timestamp)
+                self._evaluated += 1
+                self._shed_sample = None
+
+        return self._set_state(max(min(float(self._pid.output), 100), 0))
+
+    def _set_state(self, state) -> bool:
+        if state == self._state:
+            return False
+
+        self._state = state
+        return True
+
+    def _condition_source(self, entity, value) -> float | None:
+        """Aggregates and filters the source, non numeric states are dropped"""
+
+        source = self._source_aggregate.update(entity, value)
+        if source is None:
+            return None
+
+        if self._source_filter is not None:
+            source = self._source_filter.update(source)
+
+        self._filtered_source = source
+
+        return source
+
+    def _stale_source(self, entity, timestamp) -> bool:
+        """Drops a sample not newer than the last one of its source, or than
+        the last evaluation, late events must not produce a zero or negative
+        dt"""
+
+        last_time = self._source_times.get(entity)
+        if last_time is not None and timestamp == last_time:
+            self._duplicates += 1
+            return True
+
+        if (last_time is not None and timestamp < last_time) or (
+            self._last_evaluation is not None
+            and timestamp <= self._last_evaluation[2]
+        ):
+            self._out_of_order += 1
+            return True
+
+        self._source_times[entity] = timestamp
+        return False
+
+    def _within_sample_time(self, source, timestamp) -> bool:
+        """Fast path, the PID discards a sample inside the sample time of
+        the last evaluation, so the gains, set point and output don't need
+        to be rendered. Config changes go through their own update. The last
+        sample shed is kept for release_shed"""
+
+        if self._last_evaluation is None:
+            return False
+
+        elapsed = timestamp - self._last_evaluation[2]
+        sample_time = self._pid.sample_time
+
+        if self._stretch > 1:
+            stretched = max(sample_time or 0, SHED_MIN_INTERVAL) * self._stretch
+            if elapsed < stretched:
+                if not sample_time or elapsed >= sample_time:
+                    self._shed += 1
+                    self._shed_sample = (source, timestamp)
+                return True
+
+        return bool(sample_time) and elapsed < sample_time
+
+    def _skip_source(self, source, timestamp) -> bool:
+        """Send on delta, skips the evaluation of a source that barely
+        changed, while the set point holds and max interval isn't reached"""
+
+        if not self._source_delta or self._last_evaluation is None:
+            return False
+
+        last_source, last_set_point, last_time = self._last_evaluation
+        if (
+            abs(source - last_source) >= self._source_delta
+            or self._pid.set_point != last_set_point
+            or timestamp - last_time >= self._max_interval
+        ):
+            return False
+
+        self._pid.skip(source, in_time=timestamp)
+        self._skipped += 1
+
+        return True
+
+
+# pylint: disable=r0902
+class Controller:
+    """A controller of the headless runtime, a core with fixed parameters
+    and the scaling of the output"""
+
+    # pylint: disable=r0913
+    def __init__(
+        self,
+        name,
+        core: ControllerCore,
+        set_point=0.0,
+        gains=(0.0, 0.0, 0.0),
+        sample_time=DEFAULT_SAMPLE_TIME,
+        windup=DEFAULT_WINDUP,
+        invert=False,
+        minimum=DEFAULT_MINIMUM,
+        maximum=DEFAULT_MAXIMUM,
+        round_type=DEFAULT_ROUND,
+        precision=DEFAULT_PRECISION,
+    ):
+        self._name = name
+        self._core = core
+        self.set_point = set_point
+        self.gains = gains
+        self.sample_time = sample_time
+        self.windup = windup
+        self.invert = invert
+        self._scale_offset = minimum
+        self._scale_span = maximum - minimum if minimum <= maximum else 0
+        self._round_value = make_rounder(round_type, precision)
+
+    @property
+    def name(self) -> str:
+        """Returns the name, unique in the registry"""
+        return self._name
+
+    @property
+    def core(self) -> ControllerCore:
+        """Returns the control pipeline"""
+        return self._core
+
+    @property
+    def value(self) -> float:
+        """Returns the output, scaled and rounded"""
+        return self._round_value(
+            self._scale_offset + self._scale_span * self._core.state / 100
+        )
+
+    def process(self, entity, value, timestamp) -> bool:
+        """Evaluate a source reading, returns if the output changed"""
+
+        core = self._core
+        sign = -1 if self.invert else 1
+        gains = [sign * gain for gain in self.gains]
+        if any(gains):
+            # The gating compares against the current set point and gains
+            core.configure(self.set_point, gains, self.sample_time, self.windup)
+
+        source = core.accept(entity, value, timestamp)
+        if source is None:
+            return False
+
+        if not any(gains):
+            return core.switch(source, self.set_point, self.invert, timestamp)
+
+        return core.evaluate(
+            source,
+            self.set_point,
+            gains,
+            self.sample_time,
+            self.windup,
+            timestamp,
+        )
+
+
+class ControllerRegistry:
+    """Controllers by name, indexed by the sources they read"""
+
+    def __init__(self):
+        self._controllers = {}
+        self._by_source = {}
+
+    def __len__(self) -> int:
+        return len(self._controllers)
+
+    def __iter__(self):
+        return iter(self._controllers.values())
+
+    def get(self, name) -> Controller | None:
+        """Returns a controller by name"""
+        return self._controllers.get(name)
+
+    def by_source(self, entity) -> list:
+        """Returns the controllers reading a source"""
+        return self._by_source.get(entity, [])
+
+    def add(self, controller: Controller) -> None:
+        """Add a controller, raises ValueError if the name is taken"""
+
+        if controller.name in self._controllers:
+            raise ValueError(f"{controller.name} is already registered")
+
+        self._controllers[controller.name] = controller
+        for entity in controller.core.sources:
+            self._by_source.setdefault(entity, []).append(controller)
+
+    def remove(self, name) -> None:
+        """Remove a controller, if registered"""
+
+        controller = self._controllers.pop(name, None)
+        if controller is None:
+            return
+
+        for entity in controller.core.sources:
+            controllers = self._by_source[entity]
+            controllers.remove(controller)
+            if not controllers:
+                del self._by_source[entity]
+
+
+class OutputSink(ABC):
+    """Receives the outputs of the runtime, write is called from the
+    scheduler for every output that changed and must not block"""
+
+    @abstractmethod
+    def write(self, name, value, timestamp) -> None:
+        """Handle the new output of a controller"""
+
+
+class MemorySink(OutputSink):
+    """Keeps the last output of every controller in memory"""
+
+    def __init__(self):
+        self.values = {}
+        self.writes = 0
+
+    def write(self, name, value, timestamp) -> None:
+        self.values[name] = value
+        self.writes += 1
+
+
+class Runtime:
+    """Headless asyncio runtime, runs the controllers of a registry from an
+    in memory bus.
+
+    Readings are published to a queue, the scheduler task drains it in
+    batches, evaluates the controllers of each source and writes the
+    outputs that changed to the sink, yielding to the loop between batches.
+    A full queue drops the reading.
+    """
+
+    def __init__(
+        self,
+        sink: OutputSink,
+        registry: ControllerRegistry | None = None,
+        queue_size=RUNTIME_QUEUE_SIZE,
+        batch_size=RUNTIME_BATCH_SIZE,
+    ):
+        self._sink = sink
+        self._registry = registry if registry is not None else ControllerRegistry()
+        self._queue = asyncio.Queue(queue_size)
+        self._batch_size = batch_size
+        self._task = None
+        self._received = 0
+        self._dropped = 0
+        self._evaluations = 0
+
+    @property
+    def registry(self) -> ControllerRegistry:
+        """Returns the controllers"""
+        return self._registry
+
+    @property
+    def received(self) -> int:
+        """Returns the number of readings processed"""
+        return self._received
+
+    @property
+    def dropped(self) -> int:
+        """Returns the number of readings dropped on a full queue"""
+        return self._dropped
+
+    @property
+    def evaluations(self) -> int:
+        """Returns the number of readings handed to a controller"""
+        return self._evaluations
+
+    @property
+    def pending(self) -> int:
+        """Returns the number of readings waiting in the queue"""
+        return self._queue.qsize()
+
+    def publish(self, entity, value, timestamp=None) -> bool:
+        """Queue a source reading, value None when it isn't a number.
+        Returns False if the queue is full and the reading was dropped"""
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        try:
+            self._queue.put_nowait((entity, value, timestamp))
+        except asyncio.QueueFull:
+            self._dropped += 1
+            return False
+
+        return True
+
+    def start(self) -> None:
+        """Start the scheduler on the running loop"""
+
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the scheduler, queued readings are left"""
+
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def join(self) -> None:
+        """Wait until every queued reading is processed"""
+        await self._queue.join()
+
+    async def _run(self) -> None:
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self._batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+
+            try:
+                self._process(batch)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+            # get doesn't suspend while readings are queued
+            await asyncio.sleep(0)
+
+    def _process(self, batch) -> None:
+        registry = self._registry
+        sink = self._sink
+        for entity, value, timestamp in batch:
+            self._received += 1
+            for controller in registry.by_source(entity):
+                try:
+                    changed = controller.process(entity, value, timestamp)
+                except Exception:  # pylint: disable=broad-except
+                    _LOGGER.exception("Error evaluating %s", controller.name)
+                    continue
+
+                self._evaluations += 1
+                if changed:
+                    sink.write(controller.name, controller.value, timestamp)
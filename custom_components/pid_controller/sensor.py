@@ -11,18 +11,19 @@ https://github.com/soloam/ha-pid-controller/
 from __future__ import annotations
 
 import logging
-from math import floor, ceil
+import time
 from typing import Any, Mapping, Optional
 
 import voluptuous as vol
 from _sha1 import sha1
 from homeassistant.components.sensor import SensorEntity, SensorDeviceClass
 from homeassistant.const import (
+    ATTR_ENTITY_ID,
     CONF_ENTITY_ID,
     CONF_NAME,
     CONF_ICON,
+    CONF_PLATFORM,
     CONF_UNIQUE_ID,
-    EVENT_HOMEASSISTANT_START,
     STATE_UNAVAILABLE,
     CONF_MINIMUM,
     CONF_MAXIMUM,
@@ -30,51 +31,256 @@ from homeassistant.const import (
     CONF_DEVICE_CLASS,
 )
 from homeassistant.core import HomeAssistant, callback
-from homeassistant.exceptions import TemplateError
+from homeassistant.exceptions import HomeAssistantError, TemplateError
 from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers.config_validation import PLATFORM_SCHEMA
-from homeassistant.helpers.event import async_track_state_change
+from homeassistant.helpers.event import (
+    TrackTemplate,
+    async_track_state_change_event,
+    async_track_template_result,
+)
+from homeassistant.helpers.start import async_at_start
 from homeassistant.helpers.template import result_as_boolean
 
 # pylint: disable=wildcard-import, unused-wildcard-import
 from .const import *
-from .pidcontroller import PIDController as PID
+from .autotune import relay_autotune
+from .pidcore.filters import AGGREGATES
+from .jobs import JobCancelled, get_job_runner
+from .fleet import TemplateGroup, share_templates, shared_template
+from .monitor import get_load_monitor, get_oscillation_monitor
+from .output import OutputWriter, PwmWriter, output_service
+from .pidcore.pidcontroller import OnOffController
+from .pidcore.pidcontroller import PIDController as PID
+from .pidcore.runtime import ControllerCore, make_rounder
+from .simulation import async_load_history, replay
 
 
 _LOGGER = logging.getLogger(__name__)
 
-PLATFORM_SCHEMA = vol.All(
+TEMPLATE_FIELDS = [
+    CONF_ENABLED,
+    CONF_ICON,
+    CONF_SETPOINT,
+    CONF_DEVICE_CLASS,
+    CONF_SAMPLE_TIME,
+    CONF_WINDUP,
+    CONF_PROPORTIONAL,
+    CONF_INTEGRAL,
+    CONF_DERIVATIVE,
+    CONF_INVERT,
+    CONF_MINIMUM,
+    CONF_MAXIMUM,
+    CONF_ROUND,
+    CONF_PRECISION,
+]
+
+# Changes on these fields can reset the PID, by default all of them do
+RESET_PID_FIELDS = [CONF_SETPOINT, CONF_ENABLED, CONF_INVERT]
+
+# Changes on these fields change the state, even if the PID output holds
+FORCE_UPDATE_FIELDS = {
+    CONF_DEVICE_CLASS,
+    CONF_ENABLED,
+    CONF_PRECISION,
+    CONF_MINIMUM,
+    CONF_MAXIMUM,
+    CONF_ROUND,
+    CONF_INVERT,
+}
+
+# Changes on these fields are written, even if the state holds, so the
+# recorded attributes replayed by the simulate service are current
+WRITE_STATE_FIELDS = FORCE_UPDATE_FIELDS | {CONF_SETPOINT}
+
+
+def validate_output(config):
+    """Validate that the output entity has a service to set it"""
+
+    entity_id = config.get(CONF_OUTPUT_ENTITY)
+    if entity_id is None:
+        return config
+
+    service, field = output_service(
+        entity_id, config.get(CONF_OUTPUT_SERVICE), config.get(CONF_OUTPUT_FIELD)
+    )
+    if service is None or field is None:
+        raise vol.Invalid(
+            f"{CONF_OUTPUT_SERVICE} and {CONF_OUTPUT_FIELD} "
+            f"are required for {entity_id}"
+        )
+
+    return config
+
+
+def validate_output_limits(config):
+    """Validate that the output limits are in order"""
+
+    if config[CONF_OUTPUT_MIN] >= config[CONF_OUTPUT_MAX]:
+        raise vol.Invalid(f"{CONF_OUTPUT_MIN} must be below {CONF_OUTPUT_MAX}")
+
+    return config
+
+
+CONTROLLER_SCHEMA = vol.All(
     PLATFORM_SCHEMA.extend(
         {
-            vol.Optional(CONF_ENABLED, default=DEFAULT_ENABLED): cv.template,
-            vol.Optional(CONF_ICON, default=DEFAULT_ICON): cv.template,
+            vol.Optional(CONF_ENABLED, default=DEFAULT_ENABLED): shared_template,
+            vol.Optional(CONF_ICON, default=DEFAULT_ICON): shared_template,
             vol.Optional(CONF_NAME, default=DEFAULT_NAME): cv.string,
             vol.Optional(CONF_UNIQUE_ID): cv.string,
-            vol.Required(CONF_SETPOINT): cv.template,
-            vol.Optional(CONF_PROPORTIONAL, default=0): cv.template,
-            vol.Optional(CONF_INTEGRAL, default=0): cv.template,
-            vol.Optional(CONF_DERIVATIVE, default=0): cv.template,
-            vol.Required(CONF_ENTITY_ID): cv.entity_id,
-            vol.Optional(CONF_INVERT, default=False): cv.template,
-            vol.Optional(CONF_PRECISION, default=DEFAULT_PRECISION): cv.template,
-            vol.Optional(CONF_MINIMUM, default=DEFAULT_MINIMUM): cv.template,
-            vol.Optional(CONF_MAXIMUM, default=DEFAULT_MAXIMUM): cv.template,
-            vol.Optional(CONF_ROUND, default=DEFAULT_ROUND): cv.template,
-            vol.Optional(CONF_SAMPLE_TIME, default=DEFAULT_SAMPLE_TIME): cv.template,
-            vol.Optional(CONF_WINDUP, default=DEFAULT_WINDUP): cv.template,
+            vol.Required(CONF_SETPOINT): shared_template,
+            vol.Optional(CONF_PROPORTIONAL, default=0): shared_template,
+            vol.Optional(CONF_INTEGRAL, default=0): shared_template,
+            vol.Optional(CONF_DERIVATIVE, default=0): shared_template,
+            vol.Required(CONF_ENTITY_ID): cv.entity_ids,
+            vol.Optional(CONF_AGGREGATION, default=DEFAULT_AGGREGATION): vol.In(
+                AGGREGATES
+            ),
+            vol.Optional(CONF_WEIGHTS, default={}): {
+                cv.entity_id: vol.Coerce(float)
+            },
+            vol.Optional(
+                CONF_FILTER_WINDOW, default=DEFAULT_FILTER_WINDOW
+            ): cv.positive_int,
+            vol.Optional(CONF_SOURCE_DELTA, default=DEFAULT_SOURCE_DELTA): vol.All(
+                vol.Coerce(float), vol.Range(min=0)
+            ),
+            vol.Optional(CONF_MAX_INTERVAL, default=DEFAULT_MAX_INTERVAL): vol.All(
+                vol.Coerce(float), vol.Range(min=0)
+            ),
+            vol.Optional(CONF_BUMPLESS, default=DEFAULT_BUMPLESS): cv.boolean,
+            vol.Optional(
+                CONF_SETPOINT_WEIGHT, default=DEFAULT_SETPOINT_WEIGHT
+            ): vol.All(vol.Coerce(float), vol.Range(min=0, max=1)),
+            vol.Optional(
+                CONF_SETPOINT_RAMP, default=DEFAULT_SETPOINT_RAMP
+            ): vol.All(vol.Coerce(float), vol.Range(min=0)),
+            vol.Optional(CONF_RESET_ON, default=RESET_PID_FIELDS): vol.All(
+                cv.ensure_list, [vol.In(RESET_PID_FIELDS)]
+            ),
+            vol.Optional(CONF_OUTPUT_MIN, default=DEFAULT_OUTPUT_MIN): vol.All(
+                vol.Coerce(float), vol.Range(min=0, max=100)
+            ),
+            vol.Optional(CONF_OUTPUT_MAX, default=DEFAULT_OUTPUT_MAX): vol.All(
+                vol.Coerce(float), vol.Range(min=0, max=100)
+            ),
+            vol.Optional(CONF_ANTI_WINDUP, default=DEFAULT_ANTI_WINDUP): vol.In(
+                PID.ANTI_WINDUP_MODES
+            ),
+            vol.Optional(
+                CONF_TRACKING_TIME, default=DEFAULT_TRACKING_TIME
+            ): vol.All(vol.Coerce(float), vol.Range(min=0)),
+            vol.Optional(CONF_PRIORITY, default=DEFAULT_PRIORITY): vol.In(PRIORITIES),
+            vol.Optional(CONF_HYSTERESIS, default=DEFAULT_HYSTERESIS): vol.All(
+                vol.Coerce(float), vol.Range(min=0)
+            ),
+            vol.Optional(CONF_MIN_ON_TIME, default=DEFAULT_MIN_ON_TIME): vol.All(
+                vol.Coerce(float), vol.Range(min=0)
+            ),
+            vol.Optional(CONF_MIN_OFF_TIME, default=DEFAULT_MIN_OFF_TIME): vol.All(
+                vol.Coerce(float), vol.Range(min=0)
+            ),
+            vol.Optional(CONF_INVERT, default=False): shared_template,
+            vol.Optional(CONF_PRECISION, default=DEFAULT_PRECISION): shared_template,
+            vol.Optional(CONF_MINIMUM, default=DEFAULT_MINIMUM): shared_template,
+            vol.Optional(CONF_MAXIMUM, default=DEFAULT_MAXIMUM): shared_template,
+            vol.Optional(CONF_ROUND, default=DEFAULT_ROUND): shared_template,
+            vol.Optional(
+                CONF_SAMPLE_TIME, default=DEFAULT_SAMPLE_TIME
+            ): shared_template,
+            vol.Optional(CONF_WINDUP, default=DEFAULT_WINDUP): shared_template,
             vol.Optional(
                 CONF_UNIT_OF_MEASUREMENT, default=DEFAULT_UNIT_OF_MEASUREMENT
             ): cv.string,
-            vol.Optional(CONF_DEVICE_CLASS, default=DEFAULT_DEVICE_CLASS): cv.template,
+            vol.Optional(
+                CONF_DEVICE_CLASS, default=DEFAULT_DEVICE_CLASS
+            ): shared_template,
+            vol.Optional(
+                CONF_METRICS_WINDOW, default=DEFAULT_METRICS_WINDOW
+            ): cv.positive_int,
+            vol.Optional(CONF_RATE_LIMIT, default={}): {
+                vol.In(TEMPLATE_FIELDS): cv.positive_time_period
+            },
+            vol.Optional(CONF_OUTPUT_ENTITY): cv.entity_id,
+            vol.Optional(CONF_OUTPUT_SERVICE): cv.service,
+            vol.Optional(CONF_OUTPUT_FIELD): cv.string,
+            vol.Optional(CONF_OUTPUT_DELTA, default=DEFAULT_OUTPUT_DELTA): vol.All(
+                vol.Coerce(float), vol.Range(min=0)
+            ),
+            vol.Optional(
+                CONF_OUTPUT_INTERVAL, default=DEFAULT_OUTPUT_INTERVAL
+            ): vol.All(vol.Coerce(float), vol.Range(min=0)),
+            vol.Optional(CONF_PWM_ENTITY): cv.entity_id,
+            vol.Optional(CONF_PWM_CYCLE, default=DEFAULT_PWM_CYCLE): vol.All(
+                vol.Coerce(float), vol.Range(min=1)
+            ),
+            vol.Optional(CONF_PWM_MIN_ON, default=DEFAULT_PWM_MIN_ON): vol.All(
+                vol.Coerce(float), vol.Range(min=0)
+            ),
+            vol.Optional(CONF_PWM_MIN_OFF, default=DEFAULT_PWM_MIN_OFF): vol.All(
+                vol.Coerce(float), vol.Range(min=0)
+            ),
         }
-    )
+    ),
+    validate_output,
+    validate_output_limits,
 )
 
+
+def validate_platform(config):
+    """Validate a controller, or a fleet of controllers, where the other
+    variables are the profile shared by all the controllers"""
+
+    if CONF_CONTROLLERS not in config:
+        return CONTROLLER_SCHEMA(config)
+
+    profile = dict(config)
+    instances = vol.Schema(vol.All(cv.ensure_list, [dict]))(
+        profile.pop(CONF_CONTROLLERS)
+    )
+
+    # Compiled once for the whole fleet
+    for field in TEMPLATE_FIELDS:
+        if field in profile:
+            profile[field] = shared_template(profile[field])
+
+    return {
+        CONF_PLATFORM: config[CONF_PLATFORM],
+        CONF_CONTROLLERS: [
+            CONTROLLER_SCHEMA({**profile, **instance}) for instance in instances
+        ],
+    }
+
+
+PLATFORM_SCHEMA = vol.All(validate_platform)
+
+
 # pylint: disable=unused-argument
 async def async_setup_platform(
     hass: HomeAssistant, config, async_add_entities, discovery_info=None
 ):
 
+    if CONF_CONTROLLERS not in config:
+        async_add_entities([build_controller(hass, config)])
+        return
+
+    ## Templates used by more than one controller of a fleet are tracked
+    ## and rendered once for all of them
+    controllers = config[CONF_CONTROLLERS]
+    template_group = TemplateGroup(hass, share_templates(controllers, TEMPLATE_FIELDS))
+
+    async_add_entities(
+        [
+            build_controller(hass, controller, template_group)
+            for controller in controllers
+        ]
+    )
+
+
+def build_controller(hass: HomeAssistant, config, template_group=None):
+    """Build a controller from its validated config"""
+
     enabled = config.get(CONF_ENABLED)
     icon = config.get(CONF_ICON)
     set_point = config.get(CONF_SETPOINT)
@@ -110,37 +316,126 @@ async def async_setup_platform(
         if template is not None:
             template.hass = hass
 
-    ## Set up platform.
-    async_add_entities(
-        [
-            PidController(
+    return PidController(
+        hass,
+        config.get(CONF_UNIQUE_ID),
+        config.get(CONF_NAME),
+        enabled,
+        icon,
+        set_point,
+        config.get(CONF_UNIT_OF_MEASUREMENT),
+        device_class,
+        sample_time,
+        windup,
+        proportional,
+        integral,
+        derivative,
+        invert,
+        minimum,
+        maximum,
+        round_type,
+        precision,
+        config.get(CONF_ENTITY_ID),
+        config.get(CONF_FILTER_WINDOW),
+        config.get(CONF_SOURCE_DELTA),
+        config.get(CONF_MAX_INTERVAL),
+        config.get(CONF_AGGREGATION),
+        config.get(CONF_WEIGHTS),
+        config.get(CONF_RATE_LIMIT),
+        config.get(CONF_METRICS_WINDOW),
+        (
+            OutputWriter(
                 hass,
-                config.get(CONF_UNIQUE_ID),
-                config.get(CONF_NAME),
-                enabled,
-                icon,
-                set_point,
-                config.get(CONF_UNIT_OF_MEASUREMENT),
-                device_class,
-                sample_time,
-                windup,
-                proportional,
-                integral,
-                derivative,
-                invert,
-                minimum,
-                maximum,
-                round_type,
-                precision,
-                config.get(CONF_ENTITY_ID),
+                config[CONF_OUTPUT_ENTITY],
+                config.get(CONF_OUTPUT_SERVICE),
+                config.get(CONF_OUTPUT_FIELD),
+                config.get(CONF_OUTPUT_DELTA),
+                config.get(CONF_OUTPUT_INTERVAL),
             )
-        ]
+            if CONF_OUTPUT_ENTITY in config
+            else None
+        ),
+        (
+            PwmWriter(
+                hass,
+                config[CONF_PWM_ENTITY],
+                config.get(CONF_PWM_CYCLE),
+                config.get(CONF_PWM_MIN_ON),
+                config.get(CONF_PWM_MIN_OFF),
+            )
+            if CONF_PWM_ENTITY in config
+            else None
+        ),
+        OnOffController(
+            config.get(CONF_HYSTERESIS),
+            config.get(CONF_MIN_ON_TIME),
+            config.get(CONF_MIN_OFF_TIME),
+        ),
+        config.get(CONF_BUMPLESS),
+        config.get(CONF_SETPOINT_WEIGHT),
+        config.get(CONF_SETPOINT_RAMP),
+        config.get(CONF_RESET_ON),
+        (config.get(CONF_OUTPUT_MIN), config.get(CONF_OUTPUT_MAX)),
+        config.get(CONF_ANTI_WINDUP),
+        config.get(CONF_TRACKING_TIME),
+        template_group,
+        config.get(CONF_PRIORITY),
     )
 
 
+@callback
+def async_schedule_startup(hass: HomeAssistant, entity) -> None:
+    """Queue a controller to start, all queued controllers start in one pass
+    on the loop iteration after Home Assistant starts, or after they were
+    queued if it is already starting or running"""
+
+    data = hass.data.setdefault(COMPONENT_DOMAIN, {})
+    pending = data.get(DATA_PENDING_STARTUP)
+
+    if pending is None:
+        pending = data[DATA_PENDING_STARTUP] = []
+
+        @callback
+        def startup():
+            for controller in data.pop(DATA_PENDING_STARTUP, []):
+                controller.async_startup()
+
+        @callback
+        def at_start(started_hass: HomeAssistant):
+            started_hass.loop.call_soon(startup)
+
+        async_at_start(hass, at_start)
+
+    pending.append(entity)
+
+
+@callback
+def async_cancel_startup(hass: HomeAssistant, entity) -> None:
+    """Remove a controller from the startup queue"""
+
+    pending = hass.data.get(COMPONENT_DOMAIN, {}).get(DATA_PENDING_STARTUP, [])
+    if entity in pending:
+        pending.remove(entity)
+
+
+def state_timestamp(state) -> float | None:
+    """Returns when a state was last reported by its entity, as a timestamp"""
+
+    if state is None:
+        return None
+
+    return getattr(state, "last_reported", state.last_updated).timestamp()
+
+
 # pylint: disable=r0902
 class PidController(SensorEntity):
 
+    # Sources and templates are tracked, every change is written directly
+    _attr_should_poll = False
+
+    # Not recorded, they would add a row of attributes on every sample
+    _unrecorded_attributes = ATTR_UNRECORDED
+
     # pylint: disable=r0913
     def __init__(
         self,
@@ -163,6 +458,25 @@ class PidController(SensorEntity):
         round_type,
         precision,
         entity_id,
+        filter_window=DEFAULT_FILTER_WINDOW,
+        source_delta=DEFAULT_SOURCE_DELTA,
+        max_interval=DEFAULT_MAX_INTERVAL,
+        aggregation=DEFAULT_AGGREGATION,
+        weights=None,
+        rate_limit=None,
+        metrics_window=DEFAULT_METRICS_WINDOW,
+        output=None,
+        pwm=None,
+        on_off=None,
+        bumpless=DEFAULT_BUMPLESS,
+        setpoint_weight=DEFAULT_SETPOINT_WEIGHT,
+        setpoint_ramp=DEFAULT_SETPOINT_RAMP,
+        reset_on=None,
+        output_limits=(DEFAULT_OUTPUT_MIN, DEFAULT_OUTPUT_MAX),
+        anti_windup=DEFAULT_ANTI_WINDUP,
+        tracking_time=DEFAULT_TRACKING_TIME,
+        template_group=None,
+        priority=DEFAULT_PRIORITY,
     ):
 
         self._attr_name = name
@@ -174,7 +488,6 @@ class PidController(SensorEntity):
         self._device_class_template = device_class
         self._sample_time_template = sample_time
         self._windup_template = windup
-        self._sensor_state = 0
         self._proportional_template = proportional
         self._integral_template = integral
         self._derivative_template = derivative
@@ -183,23 +496,61 @@ class PidController(SensorEntity):
         self._maximum_template = maximum
         self._round_template = round_type
         self._precision_template = precision
-        self._entities = []
-        self._force_update = []
-        self._reset_pid = []
+        self._rate_limit = rate_limit or {}
+        self._metrics_window = metrics_window
+        self._template_group = template_group
+        # Equal templates render the same, a fleet shares the results
+        self._template_results = (
+            template_group.results if template_group is not None else {}
+        )
         self._feedback_pid = []
-        self._pid = None
-        self._source = entity_id
+        self._sources = entity_id if isinstance(entity_id, list) else [entity_id]
+        self._aggregation = aggregation
+        self._weights = weights or {}
+        self._filter_window = filter_window
+        self._priority = priority
         self._tunning = False
         self._updating = False
         self._tunnig_calculating = False
         self._tunning_data = {}
+        self._oscillation = {}
+        self._output = output
+        self._pwm = pwm
+        self._bumpless = bumpless
+        self._setpoint_weight = setpoint_weight
+        self._setpoint_ramp = setpoint_ramp
+        self._output_limits = output_limits
+        self._anti_windup = anti_windup
+        self._tracking_time = tracking_time
+        # Bumpless keeps the integral over set point changes
+        self._reset_fields = set(RESET_PID_FIELDS if reset_on is None else reset_on)
+        if bumpless:
+            self._reset_fields.discard(CONF_SETPOINT)
+
+        self._core = ControllerCore(
+            self._sources,
+            filter_window=filter_window,
+            source_delta=source_delta,
+            max_interval=max_interval,
+            aggregation=aggregation,
+            weights=weights,
+            metrics_window=metrics_window,
+            on_off=on_off,
+            reset_on_set_point=CONF_SETPOINT in self._reset_fields,
+            setpoint_weight=setpoint_weight,
+            setpoint_ramp=setpoint_ramp,
+            output_limits=output_limits,
+            anti_windup=anti_windup,
+            tracking_time=tracking_time,
+            logger=_LOGGER,
+        )
 
-        self._enabled_entities = []
-        self._p_entities = []
-        self._i_entities = []
-        self._d_entities = []
-
-        self._get_entities()
+        self._started = False
+        self._is_enabled = DEFAULT_ENABLED
+        self._scale_offset = float(DEFAULT_MINIMUM)
+        self._scale_span = float(DEFAULT_MAXIMUM - DEFAULT_MINIMUM)
+        self._round_value = None
+        self._native_value = None
 
         self._attr_unique_id = (
             str(
@@ -222,34 +573,41 @@ class PidController(SensorEntity):
     def native_value(self):
         """Return the state of the sensor."""
 
-        if not self.enabled:
-            return self.minimum
+        if not self._started:
+            return None
+
+        if self._native_value is None:
+            self._native_value = self._scale_state()
+
+        return self._native_value
+
+    def _scale_state(self):
+        """Scale the raw PID output with the precomputed pipeline"""
+
+        if not self._is_enabled:
+            return self._scale_offset
 
         state = 0
         try:
-            state = float(self._sensor_state) / 100
+            state = float(self._core.state) / 100
         except ValueError:
             state = 0
 
-        if self.minimum > self.maximum:
-            state = 0
+        state = self._round_value(self._scale_offset + self._scale_span * state)
 
-        units = self.units * state
-        state = self.minimum + units
-
-        precision = pow(10, self.precision)
+        return state if self.available else STATE_UNAVAILABLE
 
-        if self.round == ROUND_FLOOR:
-            state = floor(state * precision) / precision
-        elif self.round == ROUND_CEIL:
-            state = ceil(state * precision) / precision
-        else:
-            state = round(state, self.precision)
+    def _update_scaling(self) -> None:
+        """Precompute the scaling inputs, only when they change"""
 
-        if self.precision == 0:
-            state = int(state)
+        minimum = self.minimum
+        maximum = self.maximum
 
-        return state if self.available else STATE_UNAVAILABLE
+        self._is_enabled = self.enabled
+        self._scale_offset = minimum
+        self._scale_span = maximum - minimum if minimum <= maximum else 0
+        self._round_value = make_rounder(self.round, self.precision)
+        self._native_value = None
 
     @property
     def available(self) -> bool:
@@ -262,7 +620,7 @@ class PidController(SensorEntity):
 
         if self._enabled_template is not None:
             try:
-                enabled = self._enabled_template.async_render(parse_result=False)
+                enabled = self._render(self._enabled_template)
             except (TemplateError, TypeError) as ex:
                 self.show_template_exception(ex, CONF_ENABLED)
                 return DEFAULT_ENABLED
@@ -276,13 +634,23 @@ class PidController(SensorEntity):
         """Returns Tunning"""
         return self._tunning
 
+    @property
+    def autotune_progress(self) -> float | None:
+        """Returns Autotune Progress, between 0 and 1"""
+        return self._tunning_data.get(ATTR_AUTOTUNE_PROGRESS)
+
+    @property
+    def autotune_result(self) -> dict | None:
+        """Returns the gains calculated by the last autotune"""
+        return self._tunning_data.get(ATTR_AUTOTUNE_RESULT)
+
     @property
     def icon(self) -> str | None:
         """Returns Icon"""
         icon = DEFAULT_ICON
         if self._icon_template is not None:
             try:
-                icon = self._icon_template.async_render(parse_result=False)
+                icon = self._render(self._icon_template)
             except (TemplateError, TypeError) as ex:
                 self.show_template_exception(ex, CONF_ICON)
                 icon = DEFAULT_ICON
@@ -298,7 +666,7 @@ class PidController(SensorEntity):
         """Return the state of the sensor."""
         state = 0
         try:
-            state = float(self._sensor_state) / 100
+            state = float(self._core.state) / 100
         except ValueError:
             state = 0
 
@@ -309,6 +677,8 @@ class PidController(SensorEntity):
         """Return entity specific state attributes."""
 
         state_attr = {}
+        if not self._started:
+            return state_attr
 
         for attr in ATTR_TO_PROPERTY:
             try:
@@ -320,27 +690,50 @@ class PidController(SensorEntity):
         return state_attr
 
     @property
-    def source(self) -> float:
-        """Returns Response"""
+    def source(self) -> float | None:
+        """Returns Response, aggregated from all entities, None if none is
+        a number"""
+        return self._core.source
 
-        source_state = self.hass.states.get(self._source)
+    def _read_source(self, entity_id) -> float | None:
+        source_state = self.hass.states.get(entity_id)
         if not source_state:
-            return float(0)
+            return None
 
         try:
             state = float(source_state.state)
         except ValueError:
-            state = float(0)
+            return None
 
         return float(state)
 
+    def _load_sources(self) -> None:
+        """Reads all source entities, afterwards only changes are read"""
+        for entity_id in self._sources:
+            self._core.load(entity_id, self._read_source(entity_id))
+
+    @property
+    def filtered_source(self) -> float | None:
+        """Returns the Response after filtering, as seen by the PID"""
+        return self._core.filtered_source
+
+    @property
+    def evaluated(self) -> int:
+        """Returns the number of source readings evaluated by the PID"""
+        return self._core.evaluated
+
+    @property
+    def skipped(self) -> int:
+        """Returns the number of source readings skipped by send on delta"""
+        return self._core.skipped
+
     @property
     def set_point(self) -> float:
         """Returns Set Point"""
 
         if self._set_point_template is not None:
             try:
-                set_point = self._set_point_template.async_render(parse_result=False)
+                set_point = self._render(self._set_point_template)
             except (TemplateError, TypeError) as ex:
                 self.show_template_exception(ex, CONF_SETPOINT)
                 return float(0)
@@ -354,15 +747,20 @@ class PidController(SensorEntity):
 
         return float(0)
 
+    @property
+    def effective_set_point(self) -> float | None:
+        """Returns the set point in use while ramping towards the set point"""
+        if not self._setpoint_ramp or self._core.pid is None:
+            return None
+        return self._core.pid.effective_set_point
+
     @property
     def device_class(self) -> SensorDeviceClass:
         """Returns Device Class"""
 
         if self._device_class_template is not None:
             try:
-                device_class = self._device_class_template.async_render(
-                    parse_result=False
-                )
+                device_class = self._render(self._device_class_template)
             except (TemplateError, TypeError) as ex:
                 self.show_template_exception(ex, CONF_DEVICE_CLASS)
                 device_class = DEFAULT_DEVICE_CLASS
@@ -375,9 +773,7 @@ class PidController(SensorEntity):
 
         if self._sample_time_template is not None:
             try:
-                sample_time = self._sample_time_template.async_render(
-                    parse_result=False
-                )
+                sample_time = self._render(self._sample_time_template)
             except (TemplateError, TypeError) as ex:
                 self.show_template_exception(ex, CONF_SAMPLE_TIME)
                 return int(DEFAULT_SAMPLE_TIME)
@@ -397,7 +793,7 @@ class PidController(SensorEntity):
 
         if self._windup_template is not None:
             try:
-                windup = self._windup_template.async_render(parse_result=False)
+                windup = self._render(self._windup_template)
             except (TemplateError, TypeError) as ex:
                 self.show_template_exception(ex, CONF_WINDUP)
                 return int(DEFAULT_WINDUP)
@@ -417,9 +813,7 @@ class PidController(SensorEntity):
 
         if self._proportional_template is not None:
             try:
-                proportional = self._proportional_template.async_render(
-                    parse_result=False
-                )
+                proportional = self._render(self._proportional_template)
             except (TemplateError, TypeError) as ex:
                 self.show_template_exception(ex, CONF_PROPORTIONAL)
                 return 0
@@ -442,7 +836,7 @@ class PidController(SensorEntity):
 
         if self._integral_template is not None:
             try:
-                integral = self._integral_template.async_render(parse_result=False)
+                integral = self._render(self._integral_template)
             except (TemplateError, TypeError) as ex:
                 self.show_template_exception(ex, CONF_INTEGRAL)
                 return float(0)
@@ -465,7 +859,7 @@ class PidController(SensorEntity):
 
         if self._derivative_template is not None:
             try:
-                derivative = self._derivative_template.async_render(parse_result=False)
+                derivative = self._render(self._derivative_template)
             except (TemplateError, TypeError) as ex:
                 self.show_template_exception(ex, CONF_DERIVATIVE)
                 return float(0)
@@ -488,7 +882,7 @@ class PidController(SensorEntity):
 
         if self._minimum_template is not None:
             try:
-                minimum = self._minimum_template.async_render(parse_result=False)
+                minimum = self._render(self._minimum_template)
             except (TemplateError, TypeError) as ex:
                 self.show_template_exception(ex, CONF_MINIMUM)
                 return float(DEFAULT_MINIMUM)
@@ -508,7 +902,7 @@ class PidController(SensorEntity):
 
         if self._maximum_template is not None:
             try:
-                maximum = self._maximum_template.async_render(parse_result=False)
+                maximum = self._render(self._maximum_template)
             except (TemplateError, TypeError) as ex:
                 self.show_template_exception(ex, CONF_MAXIMUM)
                 return float(DEFAULT_MAXIMUM)
@@ -528,7 +922,7 @@ class PidController(SensorEntity):
 
         if self._round_template is not None:
             try:
-                round_type = self._round_template.async_render(parse_result=False)
+                round_type = self._render(self._round_template)
             except (TemplateError, TypeError) as ex:
                 self.show_template_exception(ex, CONF_ROUND)
                 return False
@@ -543,7 +937,7 @@ class PidController(SensorEntity):
 
         if self._invert_template is not None:
             try:
-                invert = self._invert_template.async_render(parse_result=False)
+                invert = self._render(self._invert_template)
             except (TemplateError, TypeError) as ex:
                 self.show_template_exception(ex, CONF_INVERT)
                 return False
@@ -556,10 +950,10 @@ class PidController(SensorEntity):
     # pylint: disable=invalid-name
     def p(self) -> float:
         """Calculated Proportional Gain"""
-        if not self._pid:
+        if not self._core.pid:
             return float(0)
 
-        p = self._pid.p
+        p = self._core.pid.p
 
         return float(p)
 
@@ -567,10 +961,10 @@ class PidController(SensorEntity):
     # pylint: disable=invalid-name
     def i(self) -> float:
         """Calculated Integral Gain"""
-        if not self._pid:
+        if not self._core.pid:
             return float(0)
 
-        i = self._pid.i
+        i = self._core.pid.i
 
         return float(i)
 
@@ -578,20 +972,163 @@ class PidController(SensorEntity):
     # pylint: disable=invalid-name
     def d(self) -> float:
         """Calculated Derivative Gain"""
-        if not self._pid:
+        if not self._core.pid:
             return float(0)
 
-        d = self._pid.d
+        d = self._core.pid.d
 
         return float(d)
 
+    @property
+    def duplicates(self) -> int:
+        """Returns the number of source samples dropped as repeated"""
+        return self._core.duplicates
+
+    @property
+    def out_of_order(self) -> int:
+        """Returns the number of source samples dropped as older than the
+        last one evaluated"""
+        return self._core.out_of_order
+
+    @property
+    def stretch(self) -> float | None:
+        """Returns how much the sample time is stretched by load shedding"""
+        stretch = self._core.stretch
+        return stretch if stretch > 1 else None
+
+    @property
+    def shed(self) -> int:
+        """Returns the number of source samples shed under loop lag"""
+        return self._core.shed
+
+    @callback
+    def async_set_stretch(self, stretch) -> None:
+        """Set by the load monitor, stretches the sample time under lag"""
+        self._core.stretch = stretch
+
+        # The last sample shed is evaluated now, not on the next reading
+        sample = self._core.release_shed()
+        if sample is not None:
+            self._async_handle_update(sample=sample)
+
+    @property
+    def switch_count(self) -> int | None:
+        """Returns the times the output switched, on On/Off mode"""
+        on_off = self._core.on_off
+        if on_off.is_on is None:
+            return None
+        return on_off.switch_count
+
+    @property
+    def iae(self) -> float | None:
+        """Integral of Absolute Error, over the metrics window"""
+        return self._core.pid.metrics.iae if self._core.pid else None
+
+    @property
+    def ise(self) -> float | None:
+        """Integral of Squared Error, over the metrics window"""
+        return self._core.pid.metrics.ise if self._core.pid else None
+
+    @property
+    def itae(self) -> float | None:
+        """Integral of Time weighted Absolute Error since the set point
+        changed, over the metrics window"""
+        return self._core.pid.metrics.itae if self._core.pid else None
+
+    @property
+    def overshoot(self) -> float | None:
+        """Peak overshoot of the source since the set point changed"""
+        return self._core.pid.metrics.overshoot if self._core.pid else None
+
+    @property
+    def settling_time(self) -> float | None:
+        """Seconds the source took to settle after the set point changed,
+        None while not settled"""
+        return self._core.pid.metrics.settling_time if self._core.pid else None
+
+    @property
+    def travel(self) -> float | None:
+        """Actuator travel, the total change of output, over the metrics
+        window"""
+        return self._core.pid.metrics.travel if self._core.pid else None
+
+    @property
+    def oscillating(self) -> bool:
+        """Returns if a sustained oscillation was detected"""
+        return self._oscillation.get("oscillating", False)
+
+    @property
+    def oscillation_period(self) -> float | None:
+        """Returns the period, in seconds, of the detected oscillation"""
+        if not self.oscillating:
+            return None
+        return self._oscillation.get("period")
+
+    @property
+    def oscillation_amplitude(self) -> float | None:
+        """Returns the amplitude of the error in the detected oscillation"""
+        if not self.oscillating:
+            return None
+        return self._oscillation.get("amplitude")
+
+    @property
+    def output_writes(self) -> int | None:
+        """Returns the number of writes to the output entity"""
+        return self._output.writes if self._output is not None else None
+
+    @property
+    def output_coalesced(self) -> int | None:
+        """Returns the number of output values replaced before being written"""
+        return self._output.coalesced if self._output is not None else None
+
+    @property
+    def pwm_duty(self) -> float | None:
+        """Returns the duty of the running PWM cycle"""
+        return self._pwm.duty if self._pwm is not None else None
+
+    @property
+    def pwm_jitter(self) -> float | None:
+        """Returns the delay of the last PWM edge, in seconds"""
+        return self._pwm.jitter if self._pwm is not None else None
+
+    @property
+    def pwm_max_jitter(self) -> float | None:
+        """Returns the largest delay of a PWM edge, in seconds"""
+        return self._pwm.max_jitter if self._pwm is not None else None
+
+    @property
+    def error_history(self) -> list:
+        """Last (time, error) samples of the PID"""
+        return self._core.pid.history if self._core.pid else []
+
+    @callback
+    def async_set_oscillation(self, result) -> None:
+        """Receives the result of the oscillation analysis"""
+
+        was_oscillating = self.oscillating
+        self._oscillation = result
+
+        if self.oscillating and not was_oscillating:
+            _LOGGER.warning(
+                "%s is oscillating, period %.1fs, amplitude %.3f",
+                self.entity_id,
+                self.oscillation_period,
+                self.oscillation_amplitude,
+            )
+            self.hass.bus.async_fire(
+                EVENT_OSCILLATION, {ATTR_ENTITY_ID: self.entity_id, **result}
+            )
+
+        if self.oscillating != was_oscillating or self.oscillating:
+            self.async_write_ha_state()
+
     @property
     def precision(self) -> int:
         """Returns Precision"""
 
         if self._precision_template is not None:
             try:
-                precision = self._precision_template.async_render(parse_result=False)
+                precision = self._render(self._precision_template)
             except (TemplateError, TypeError) as ex:
                 self.show_template_exception(ex, CONF_PRECISION)
                 return int(DEFAULT_PRECISION)
@@ -615,222 +1152,438 @@ class PidController(SensorEntity):
         else:
             _LOGGER.error('Error parsing template for field "%s": %s', field, ex)
 
-    def _get_entities(self) -> None:
-        self._entities = []
-        self._force_update = []
+    @property
+    def _templates(self) -> dict:
+        """Templates by field"""
+        return {
+            CONF_ENABLED: self._enabled_template,
+            CONF_ICON: self._icon_template,
+            CONF_SETPOINT: self._set_point_template,
+            CONF_DEVICE_CLASS: self._device_class_template,
+            CONF_SAMPLE_TIME: self._sample_time_template,
+            CONF_WINDUP: self._windup_template,
+            CONF_PROPORTIONAL: self._proportional_template,
+            CONF_INTEGRAL: self._integral_template,
+            CONF_DERIVATIVE: self._derivative_template,
+            CONF_INVERT: self._invert_template,
+            CONF_MINIMUM: self._minimum_template,
+            CONF_MAXIMUM: self._maximum_template,
+            CONF_ROUND: self._round_template,
+            CONF_PRECISION: self._precision_template,
+        }
 
-        if self._icon_template is not None:
-            try:
-                info = self._icon_template.async_render_to_info()
-            except (TemplateError, TypeError) as ex:
-                self.show_template_exception(ex, CONF_ICON)
-            else:
-                self._entities += info.entities
+    def _render(self, template):
+        """Renders a template, reusing the last result seen by the template
+        tracking, so only templates that changed are rendered again"""
 
-        if self._set_point_template is not None:
+        result = self._template_results.get(template)
+        if result is None:
             try:
-                info = self._set_point_template.async_render_to_info()
+                result = template.async_render(parse_result=False)
             except (TemplateError, TypeError) as ex:
-                self.show_template_exception(ex, CONF_SETPOINT)
-            else:
-                self._entities += info.entities
-                self._reset_pid += info.entities
+                result = ex
+            self._template_results[template] = result
+
+        if isinstance(result, Exception):
+            raise result
+
+        return result
+
+    @callback
+    def _async_track_templates(self) -> None:
+        """Track the templates results, entities referenced in a template
+        update it immediately, templates over all states or whole domains
+        are rate limited, and dependencies are tracked again when they
+        change"""
+
+        template_fields = {}
+        group_fields = {}
+        rate_limits = {}
+        group = self._template_group
+        for field, template in self._templates.items():
+            if template is None:
+                continue
 
-        if self._device_class_template is not None:
-            try:
-                info = self._device_class_template.async_render_to_info()
-            except (TemplateError, TypeError) as ex:
-                self.show_template_exception(ex, CONF_DEVICE_CLASS)
+            if group is not None and template in group.templates:
+                group_fields.setdefault(template, []).append(field)
             else:
-                self._entities += info.entities
-                self._force_update += info.entities
+                template_fields.setdefault(template, []).append(field)
+            rate_limits.setdefault(template, []).append(self._rate_limit.get(field))
 
-        if self._sample_time_template is not None:
-            try:
-                info = self._sample_time_template.async_render_to_info()
-            except (TemplateError, TypeError) as ex:
-                self.show_template_exception(ex, CONF_SAMPLE_TIME)
-            else:
-                self._entities += info.entities
+        # The lowest rate limit of the fields, none if a field has none
+        rate_limits = {
+            template: None if None in values else min(values)
+            for template, values in rate_limits.items()
+        }
 
-        if self._windup_template is not None:
-            try:
-                info = self._windup_template.async_render_to_info()
-            except (TemplateError, TypeError) as ex:
-                self.show_template_exception(ex, CONF_WINDUP)
-            else:
-                self._entities += info.entities
+        @callback
+        def template_listener(event, updates):
+            """Handle template result changes."""
+            changed = set()
+            for update in updates:
+                result = update.result
+                result = result if isinstance(result, TemplateError) else str(result)
+                # The first results after tracking starts are all reported as
+                # new, skip the ones already rendered
+                if self._template_results.get(update.template) == result:
+                    continue
+
+                self._template_results[update.template] = result
+                changed.update(template_fields.get(update.template, []))
+
+            self._async_handle_update(changed=changed)
+
+        if group_fields:
+            self.async_on_remove(
+                group.async_register(self, group_fields, rate_limits)
+            )
 
-        if self._enabled_template is not None:
-            try:
-                info = self._enabled_template.async_render_to_info()
-            except (TemplateError, TypeError) as ex:
-                self.show_template_exception(ex, CONF_ENABLED)
-            else:
-                self._entities += info.entities
-                self._reset_pid += info.entities
-                self._force_update += info.entities
-                self._enabled_entities += info.entities
+        if not template_fields:
+            return
 
-        if self._proportional_template is not None:
-            try:
-                info = self._proportional_template.async_render_to_info()
-            except (TemplateError, TypeError) as ex:
-                self.show_template_exception(ex, CONF_PROPORTIONAL)
-            else:
-                self._entities += info.entities
-                self._p_entities += info.entities
+        info = async_track_template_result(
+            self.hass,
+            [
+                TrackTemplate(template, None, rate_limits.get(template))
+                for template in template_fields
+            ],
+            template_listener,
+        )
+        self.async_on_remove(info.async_remove)
 
-        if self._integral_template is not None:
-            try:
-                info = self._integral_template.async_render_to_info()
-            except (TemplateError, TypeError) as ex:
-                self.show_template_exception(ex, CONF_INTEGRAL)
-            else:
-                self._entities += info.entities
-                self._i_entities += info.entities
+    @callback
+    def async_templates_changed(self, changed) -> None:
+        """Handle the fields changed by shared templates of a fleet"""
+        self._async_handle_update(changed=changed)
 
-        if self._derivative_template is not None:
-            try:
-                info = self._derivative_template.async_render_to_info()
-            except (TemplateError, TypeError) as ex:
-                self.show_template_exception(ex, CONF_DERIVATIVE)
-            else:
-                self._entities += info.entities
-                self._d_entities += info.entities
+    def reset_pid(self):
+        self._core.reset()
 
-        if self._precision_template is not None:
-            try:
-                info = self._precision_template.async_render_to_info()
-            except (TemplateError, TypeError) as ex:
-                self.show_template_exception(ex, CONF_PRECISION)
-            else:
-                self._entities += info.entities
-                self._force_update += info.entities
+    @property
+    def _autotune_job(self) -> str:
+        return f"{self.entity_id}_autotune"
+
+    def start_autotune(self) -> None:
+        """Start a relay autotune, the output toggles between 0 and 100
+        around the set point and the gains are calculated from the
+        resulting oscillation"""
+
+        if self._tunning or self._tunnig_calculating:
+            raise HomeAssistantError("is already tunning")
+
+        self._tunning = True
+        self._core.invalidate()
+        self._tunning_data = {
+            "started": time.time(),
+            "samples": [],
+            "switches": 0,
+            ATTR_AUTOTUNE_PROGRESS: 0.0,
+        }
+        self.async_write_ha_state()
 
-        if self._minimum_template is not None:
-            try:
-                info = self._minimum_template.async_render_to_info()
-            except (TemplateError, TypeError) as ex:
-                self.show_template_exception(ex, CONF_MINIMUM)
-            else:
-                self._entities += info.entities
-                self._force_update += info.entities
+    def cancel_autotune(self) -> None:
+        """Stop a running autotune"""
 
-        if self._maximum_template is not None:
-            try:
-                info = self._maximum_template.async_render_to_info()
-            except (TemplateError, TypeError) as ex:
-                self.show_template_exception(ex, CONF_MAXIMUM)
-            else:
-                self._entities += info.entities
-                self._force_update += info.entities
+        if self._tunnig_calculating:
+            get_job_runner(self.hass).async_cancel(self._autotune_job)
+        elif self._tunning:
+            self._tunning = False
+            self._tunning_data = {}
+            self.async_write_ha_state()
+        else:
+            raise HomeAssistantError("is not tunning")
 
-        if self._round_template is not None:
-            try:
-                info = self._round_template.async_render_to_info()
-            except (TemplateError, TypeError) as ex:
-                self.show_template_exception(ex, CONF_ROUND)
-            else:
-                self._entities += info.entities
-                self._force_update += info.entities
+    def _update_autotune(self, source, set_point, now) -> None:
+        data = self._tunning_data
 
-        if self._invert_template is not None:
-            try:
-                info = self._invert_template.async_render_to_info()
-            except (TemplateError, TypeError) as ex:
-                self.show_template_exception(ex, CONF_INVERT)
-            else:
-                self._entities += info.entities
-                self._force_update += info.entities
-                self._reset_pid += info.entities
+        relay_on = source < set_point
+        samples = data["samples"]
+        if samples and samples[-1][2] != relay_on:
+            data["switches"] += 1
 
-        self._entities += [self._source]
+        samples.append((now, source, relay_on))
 
-    def reset_pid(self):
-        if self._pid:
-            self._pid.reset_pid()
+        self._core.state = 100 if relay_on != self.invert else 0
+        self._native_value = None
 
-    def update(self) -> None:
-        """Update the sensor state if it needed."""
-        self._update_sensor()
+        # First switch ends the transient, then two per oscillation
+        switches = 2 * AUTOTUNE_CYCLES + 1
+        data[ATTR_AUTOTUNE_PROGRESS] = min(data["switches"] / switches, 1) / 2
 
-    def _update_sensor(self, entity=None) -> None:
-        if entity in self._reset_pid:
-            self.reset_pid()
+        if data["switches"] >= switches:
+            self._tunning = False
+            self._tunnig_calculating = True
+            self.hass.async_create_task(self._async_calculate_autotune(samples))
+        elif now - data["started"] > AUTOTUNE_TIMEOUT:
+            _LOGGER.warning("%s autotune timed out", self.entity_id)
+            self._tunning = False
+            self._tunning_data = {}
 
-        if not self.enabled:
-            return
+    async def _async_calculate_autotune(self, samples) -> None:
+        """Calculate the autotune gains in the executor"""
 
-        source = self.source
-        set_point = self.set_point
+        try:
+            result = await get_job_runner(self.hass).async_run(
+                self._autotune_job,
+                relay_autotune,
+                samples,
+                on_progress=self._autotune_progress,
+            )
+        except JobCancelled:
+            _LOGGER.info("%s autotune cancelled", self.entity_id)
+            self._tunning_data = {}
+        except ValueError as ex:
+            _LOGGER.warning("%s autotune failed: %s", self.entity_id, ex)
+            self._tunning_data = {}
+        else:
+            _LOGGER.info("%s autotune result %s", self.entity_id, result)
+            self._tunning_data = {ATTR_AUTOTUNE_RESULT: result}
+            self.hass.bus.async_fire(
+                EVENT_AUTOTUNE, {ATTR_ENTITY_ID: self.entity_id, **result}
+            )
+        finally:
+            self._tunnig_calculating = False
+            self.async_write_ha_state()
+
+    async def async_simulate(self, gains, start, end) -> dict:
+        """Replay the recorded source and set point between start and end
+        with other gains, missing gains keep the current ones"""
+
+        sign = -1 if self.invert else 1
+        gains = [
+            current if gains.get(field) is None else sign * gains[field]
+            for field, current in (
+                (CONF_PROPORTIONAL, self.proportional),
+                (CONF_INTEGRAL, self.integral),
+                (CONF_DERIVATIVE, self.derivative),
+            )
+        ]
 
-        if self.proportional == 0 and self.integral == 0 and self.derivative == 0:
-            if entity != self._source:
-                return
+        offset = self._scale_offset
+        span = self._scale_span
+        round_value = self._round_value or make_rounder(DEFAULT_ROUND, 2)
+
+        settings = {
+            CONF_SAMPLE_TIME: self.sample_time,
+            CONF_WINDUP: self.windup,
+            CONF_AGGREGATION: self._aggregation,
+            CONF_WEIGHTS: self._weights,
+            CONF_FILTER_WINDOW: self._filter_window,
+            CONF_METRICS_WINDOW: self._metrics_window,
+            CONF_BUMPLESS: CONF_SETPOINT not in self._reset_fields,
+            CONF_SETPOINT_WEIGHT: self._setpoint_weight,
+            CONF_SETPOINT_RAMP: self._setpoint_ramp,
+            CONF_OUTPUT_MIN: self._output_limits[0],
+            CONF_OUTPUT_MAX: self._output_limits[1],
+            CONF_ANTI_WINDUP: self._anti_windup,
+            CONF_TRACKING_TIME: self._tracking_time,
+            "scale": lambda output: round_value(offset + span * output / 100),
+        }
 
-            self._sensor_state = 0 if self.invert else 100
-            if source >= set_point:
-                self._sensor_state = 100 if self.invert else 0
-        else:
-            p_base = self.proportional
-            i_base = self.integral
-            d_base = self.derivative
+        states = await async_load_history(
+            self.hass, [self.entity_id, *self._sources], start, end
+        )
 
-            if self._pid is None:
-                self._pid = PID(p_base, i_base, d_base, logger=_LOGGER)
-            else:
-                if p_base != self._pid.kp:
-                    self._pid.kp = p_base
-                if i_base != self._pid.ki:
-                    self._pid.ki = i_base
-                if d_base != self._pid.kd:
-                    self._pid.kd = d_base
+        try:
+            result = await get_job_runner(self.hass).async_run(
+                f"{self.entity_id}_simulate",
+                replay,
+                states,
+                self.entity_id,
+                self._sources,
+                gains,
+                settings,
+            )
+        except JobCancelled as ex:
+            raise HomeAssistantError("simulation cancelled") from ex
+
+        return {
+            ATTR_GAINS: dict(
+                zip((CONF_PROPORTIONAL, CONF_INTEGRAL, CONF_DERIVATIVE), gains)
+            ),
+            **result,
+        }
+
+    @callback
+    def _autotune_progress(self, name, progress) -> None:
+        self._tunning_data[ATTR_AUTOTUNE_PROGRESS] = 0.5 + progress / 2
+        self.async_write_ha_state()
 
-            if self.sample_time != self._pid.sample_time:
-                self._pid.sample_time = self.sample_time
+    async def async_update(self) -> None:
+        """Refresh the sensor, only on request as it isn't polled. Runs in
+        the event loop, as the source and template listeners do"""
+        if self._started:
+            self._update_sensor()
 
-            if self.windup != self._pid.windup:
-                self._pid.windup = self.windup
+    def export_state(self) -> dict:
+        """Returns the PID and output state, to restore with import_state"""
+        return self._core.snapshot()
 
-            if set_point != self._pid.set_point:
+    @staticmethod
+    def check_state(snapshot) -> None:
+        """Raises KeyError, TypeError or ValueError on an invalid state"""
+        ControllerCore.check_snapshot(snapshot)
+
+    def import_state(self, snapshot) -> None:
+        """Restore a state from export_state, checked with check_state. The
+        gains and set point of the config apply again on the next update"""
+
+        self._core.restore(snapshot)
+        self._native_value = None
+
+    def _update_sensor(
+        self, entity=None, changed=None, timestamp=None, sample=None
+    ) -> None:
+        """Update the PID, entity is the source that changed and timestamp
+        when it did, changed are the fields whose templates changed, none of
+        them refreshes all. sample is a shed (source, timestamp) to evaluate"""
+
+        changed = changed or set()
+
+        if not changed.isdisjoint(self._reset_fields):
+            # A set point change keeps the On/Off minimum times
+            if changed & self._reset_fields == {CONF_SETPOINT}:
+                self._core.reset_pid()
+            else:
                 self.reset_pid()
-                self._pid.set_point = set_point
 
-            if entity == self._source:
-                self._pid.update(source)
+        if (entity is None and not changed) or not changed.isdisjoint(
+            FORCE_UPDATE_FIELDS
+        ):
+            self._update_scaling()
+
+        if not self._is_enabled:
+            return
+
+        source = None
+        if sample is not None:
+            source, timestamp = sample
+        elif entity in self._sources:
+            if timestamp is None:
+                timestamp = time.time()
+
+            # The autotune relay sees every reading, not only sampled ones
+            source = self._core.accept(
+                entity,
+                self._read_source(entity),
+                timestamp,
+                fast_path=not self._tunning,
+            )
+            if source is None:
+                return
+
+        set_point = self.set_point
 
-            output = float(self._pid.output)
+        if self._tunning:
+            if source is not None:
+                self._update_autotune(source, set_point, timestamp)
+            return
 
-            output = max(min(output, 100), 0)
-            self._sensor_state = output
+        gains = (self.proportional, self.integral, self.derivative)
+        if not any(gains):
+            changed_state = self._core.switch(
+                source, set_point, self.invert, timestamp
+            )
+        else:
+            changed_state = self._core.evaluate(
+                source, set_point, gains, self.sample_time, self.windup, timestamp
+            )
+
+        if changed_state:
+            self._native_value = None
 
     async def async_added_to_hass(self) -> None:
         """Register callbacks."""
 
-        # pylint: disable=unused-argument
-        @callback
-        def sensor_state_listener(entity, old_state, new_state):
-            """Handle device state changes."""
-            last_state = self.state
-            self._update_sensor(entity=entity)
-            if last_state != self.state or entity in self._force_update:
-                self.async_schedule_update_ha_state(True)
-
-        # pylint: disable=unused-argument
+        async_schedule_startup(self.hass, self)
+
+    @callback
+    def async_startup(self) -> None:
+        """Track the templates and sources, runs once Home Assistant started"""
+
         @callback
-        def sensor_startup(event):
-            """Update template on startup."""
+        def source_listener(event):
+            """Handle source state changes."""
+            self._async_handle_update(
+                entity=event.data[ATTR_ENTITY_ID],
+                timestamp=state_timestamp(event.data.get("new_state")),
+            )
 
-            self._update_sensor()
+        self._started = True
+        self._async_track_templates()
+        self._load_sources()
+        self._update_sensor()
+
+        self.async_write_ha_state()
+        self._async_write_output()
+
+        if self._pwm is not None:
+            self._async_set_duty()
+            self._pwm.async_start()
+            self.async_on_remove(self._pwm.async_stop)
+
+        self.async_on_remove(get_oscillation_monitor(self.hass).async_register(self))
+
+        self.async_on_remove(
+            get_load_monitor(self.hass).async_register(self, self._priority)
+        )
+
+        controllers = self.hass.data.setdefault(COMPONENT_DOMAIN, {}).setdefault(
+            DATA_CONTROLLERS, {}
+        )
+        controllers[self.entity_id] = self
+        self.async_on_remove(lambda: controllers.pop(self.entity_id, None))
+
+        ## Sources are never rate limited
+        self.async_on_remove(
+            async_track_state_change_event(self.hass, self._sources, source_listener)
+        )
+
+    @callback
+    def _async_handle_update(
+        self, entity=None, changed=None, timestamp=None, sample=None
+    ) -> None:
+        last_state = self.native_value
+        self._update_sensor(
+            entity=entity, changed=changed, timestamp=timestamp, sample=sample
+        )
+        self._async_set_duty()
+        # State is already computed, write it without a second refresh
+        if last_state != self.native_value or (
+            changed and not changed.isdisjoint(FORCE_UPDATE_FIELDS)
+        ):
+            self.async_write_ha_state()
+            self._async_write_output()
+        elif changed and not changed.isdisjoint(WRITE_STATE_FIELDS):
+            self.async_write_ha_state()
+
+    @callback
+    def _async_set_duty(self) -> None:
+        """Set the duty of the PWM output, if configured, from the raw state"""
+
+        if self._pwm is not None:
+            self._pwm.async_set_duty(self.raw_state if self._is_enabled else 0)
+
+    @callback
+    def _async_write_output(self) -> None:
+        """Send the state to the output entity, if configured"""
+
+        if self._output is None:
+            return
+
+        value = self.native_value
+        if isinstance(value, (int, float)):
+            self._output.async_write(value)
 
-            self.async_schedule_update_ha_state(True)
+    async def async_will_remove_from_hass(self) -> None:
+        """Stop background jobs."""
+        async_cancel_startup(self.hass, self)
 
-            ## process listners
-            for entity in self._entities:
-                async_track_state_change(self.hass, entity, sensor_state_listener)
+        if self._output is not None:
+            self._output.async_cancel()
 
-        self.hass.bus.async_listen_once(EVENT_HOMEASSISTANT_START, sensor_startup)
+        if self._tunnig_calculating:
+            get_job_runner(self.hass).async_cancel(self._autotune_job)
 
     def update_entity(self, entity_id, state):
         entity = self.hass.states.get(entity_id)
@@ -0,0 +1,195 @@
+#
+#  Copyright (c) 2022, Diogo Silva "Soloam"
+#  Creative Commons BY-NC-SA 4.0 International Public License
+#  (see LICENSE.md or https://creativecommons.org/licenses/by-nc-sa/4.0/)
+#
+"""
+PID Controller.
+For more details about this sensor, please refer to the documentation at
+https://github.com/soloam/ha-pid-controller/
+"""
+from datetime import datetime, timezone
+from functools import partial
+
+from homeassistant.core import HomeAssistant
+
+# pylint: disable=wildcard-import, unused-wildcard-import
+from .const import *
+from .pidcore.filters import SlidingMedian, SourceAggregate
+from .pidcore.pidcontroller import ControlMetrics, PIDController
+
+EVENT_SET_POINT = 0
+EVENT_ACTUAL = 1
+EVENT_SOURCE = 2
+
+PROGRESS_EVENTS = 1000
+
+
+async def async_load_history(hass: HomeAssistant, entity_ids, start, end):
+    """Loads the history of all entities in one recorder query"""
+
+    # pylint: disable=import-outside-toplevel
+    from homeassistant.components.recorder import get_instance, history
+
+    return await get_instance(hass).async_add_executor_job(
+        partial(
+            history.get_significant_states,
+            hass,
+            start,
+            end,
+            entity_ids,
+            include_start_time_state=True,
+            significant_changes_only=False,
+            minimal_response=False,
+            no_attributes=False,
+        )
+    )
+
+
+def _as_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def history_events(states, controller, sources):
+    """Merges the history of the controller and its sources in time order"""
+
+    events = []
+
+    for state in states.get(controller, []):
+        timestamp = state.last_updated.timestamp()
+        set_point = _as_float(state.attributes.get(ATTR_SETPOINT))
+        if set_point is not None:
+            events.append((timestamp, EVENT_SET_POINT, controller, set_point))
+
+        actual = _as_float(state.state)
+        if actual is not None:
+            events.append((timestamp, EVENT_ACTUAL, controller, actual))
+
+    for source in sources:
+        for state in states.get(source, []):
+            events.append(
+                (
+                    state.last_updated.timestamp(),
+                    EVENT_SOURCE,
+                    source,
+                    _as_float(state.state),
+                )
+            )
+
+    events.sort(key=lambda event: (event[0], event[1]))
+
+    return events
+
+
+def replay(context, states, controller, sources, gains, settings):
+    """Replays the recorded source and set point through a new PID with the
+    given gains, and returns the predicted output next to the actual one.
+
+    The replay is open loop, the readings are the recorded ones, so it shows
+    what the PID would have output for the same readings. The error based
+    metrics are the same for both, travel shows the actuator effort.
+    """
+
+    events = history_events(states, controller, sources)
+
+    pid = PIDController(
+        *gains,
+        metrics_window=settings[CONF_METRICS_WINDOW],
+        setpoint_weight=settings[CONF_SETPOINT_WEIGHT],
+        setpoint_ramp=settings[CONF_SETPOINT_RAMP],
+        output_limits=(settings[CONF_OUTPUT_MIN], settings[CONF_OUTPUT_MAX]),
+        anti_windup=settings[CONF_ANTI_WINDUP],
+        tracking_time=settings[CONF_TRACKING_TIME],
+    )
+    pid.windup = settings[CONF_WINDUP]
+
+    aggregate = SourceAggregate(settings[CONF_AGGREGATION], settings[CONF_WEIGHTS])
+    source_filter = (
+        SlidingMedian(settings[CONF_FILTER_WINDOW])
+        if settings[CONF_FILTER_WINDOW] > 1
+        else None
+    )
+    scale = settings["scale"]
+
+    predicted_metrics = ControlMetrics(settings[CONF_METRICS_WINDOW])
+    actual_metrics = ControlMetrics(settings[CONF_METRICS_WINDOW])
+    predicted = []
+    actual = []
+
+    set_point = None
+    actual_value = None
+    last_time = None
+
+    for index, (timestamp, kind, entity_id, value) in enumerate(events):
+        if index % PROGRESS_EVENTS == 0:
+            context.report_progress(index / len(events))
+
+        if kind == EVENT_SET_POINT:
+            if value != set_point:
+                if not settings[CONF_BUMPLESS]:
+                    pid.reset_pid()
+                pid.set_point = value
+                set_point = value
+            continue
+
+        if kind == EVENT_ACTUAL:
+            if value != actual_value:
+                actual_value = value
+                actual.append((timestamp, value))
+            continue
+
+        source = aggregate.update(entity_id, value)
+        if source is None or set_point is None:
+            continue
+
+        if source_filter is not None:
+            source = source_filter.update(source)
+
+        pid.sample_time = settings[CONF_SAMPLE_TIME]
+        pid.update(source, in_time=timestamp)
+
+        output = scale(max(min(float(pid.output), 100), 0))
+        if not predicted or predicted[-1][1] != output:
+            predicted.append((timestamp, output))
+
+        error = set_point - source
+        delta_time = timestamp - last_time if last_time is not None else 0
+        last_time = timestamp
+
+        predicted_metrics.update(error, output, delta_time, timestamp)
+        if actual_value is not None:
+            actual_metrics.update(error, actual_value, delta_time, timestamp)
+
+    context.report_progress(1)
+
+    return {
+        "predicted": {
+            "trace": _trace(predicted),
+            "metrics": _metrics(predicted_metrics),
+        },
+        "actual": {
+            "trace": _trace(actual),
+            "metrics": _metrics(actual_metrics),
+        },
+    }
+
+
+def _trace(points):
+    return [
+        [datetime.fromtimestamp(timestamp, timezone.utc).isoformat(), value]
+        for timestamp, value in points
+    ]
+
+
+def _metrics(metrics):
+    return {
+        ATTR_IAE: metrics.iae,
+        ATTR_ISE: metrics.ise,
+        ATTR_ITAE: metrics.itae,
+        ATTR_OVERSHOOT: metrics.overshoot,
+        ATTR_SETTLING_TIME: metrics.settling_time,
+        ATTR_TRAVEL: metrics.travel,
+    }
@@ -0,0 +1 @@
+"""Tests for the PID Controller integration"""
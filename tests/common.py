@@ -0,0 +1,94 @@
+"""Helpers to run the integration on a bare Home Assistant"""
+import asyncio
+
+from homeassistant import config_entries, loader
+from homeassistant.const import EVENT_HOMEASSISTANT_START
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import (
+    area_registry,
+    device_registry,
+    entity,
+    entity_registry,
+    floor_registry,
+    label_registry,
+    restore_state,
+    template,
+    translation,
+)
+from homeassistant.setup import async_setup_component
+
+SOURCE = "sensor.source"
+
+CONTROLLER = {
+    "platform": "pid_controller",
+    "name": "pid",
+    "set_point": "{{ states('input_number.set_point') }}",
+    "p": "5",
+    "i": "0.1",
+    "d": "0",
+    "entity_id": SOURCE,
+}
+
+
+async def async_create_hass(config_dir) -> HomeAssistant:
+    """Returns a Home Assistant with the core helpers loaded, not started"""
+
+    hass = HomeAssistant(str(config_dir))
+    hass.config.skip_pip = True
+    loader.async_setup(hass)
+    translation.async_setup(hass)
+    entity.async_setup(hass)
+    template.async_setup(hass)
+    for registry in (
+        area_registry,
+        floor_registry,
+        label_registry,
+        device_registry,
+        entity_registry,
+    ):
+        await registry.async_load(hass)
+    await restore_state.async_load(hass)
+    hass.config_entries = config_entries.ConfigEntries(hass, {})
+    await hass.config_entries.async_initialize()
+    assert await async_setup_component(hass, "homeassistant", {})
+
+    hass.states.async_set("input_number.set_point", "20")
+    hass.states.async_set(SOURCE, "15")
+
+    return hass
+
+
+async def async_setup_controllers(hass, controllers, start=True) -> None:
+    """Set up the integration and the sensor platform with the controllers,
+    and fire the start event"""
+
+    assert await async_setup_component(hass, "pid_controller", {"pid_controller": {}})
+    assert await async_setup_component(hass, "sensor", {"sensor": controllers})
+    await hass.async_block_till_done()
+
+    if start:
+        hass.bus.async_fire(EVENT_HOMEASSISTANT_START)
+        await hass.async_block_till_done()
+
+
+def get_controller(hass, entity_id):
+    """Returns the entity object of a controller"""
+    return hass.data["sensor"].get_entity(entity_id)
+
+
+def run(test):
+    """Run a coroutine test on a new Home Assistant, stopped afterwards"""
+
+    def wrapper(tmp_path):
+        async def main():
+            hass = await async_create_hass(tmp_path)
+            try:
+                await test(hass)
+            finally:
+                await hass.async_stop(force=True)
+
+        asyncio.run(main())
+
+    wrapper.__name__ = test.__name__
+    wrapper.__doc__ = test.__doc__
+    return wrapper
@@ -0,0 +1,6 @@
+"""Fixtures for the PID Controller tests"""
+import sys
+from pathlib import Path
+
+# The integration is imported as custom_components.pid_controller
+sys.path.insert(0, str(Path(__file__).parents[1]))
@@ -0,0 +1,139 @@
+"""Golden traces of the PID and the controller core.
+
+The scenarios are replayed on PIDController and ControllerCore and every
+sample is recorded, the traces are stored as JSON in golden and compared by
+test_golden. Regenerate them, after a deliberate change of the control
+behaviour, with:
+
+    python -m tests.golden_traces
+"""
+import json
+import math
+import random
+from pathlib import Path
+
+from custom_components.pid_controller.pidcore.pidcontroller import PIDController
+from custom_components.pid_controller.pidcore.runtime import ControllerCore
+
+GOLDEN_DIR = Path(__file__).parent / "golden"
+SOURCE = "sensor.source"
+
+# Signed gains, direct and reverse acting, with and without D
+GAINS = [(5, 0.1, 0), (2, 0.5, 1), (10, 0, 3), (-3, -0.2, 0)]
+
+
+def _step():
+    return [(i * 1.0, 10.0 if i < 5 else 18.0, 20.0) for i in range(200)]
+
+
+def _ramp():
+    return [(i * 1.0, 5 + i * 0.1, 20.0) for i in range(300)]
+
+
+def _noisy():
+    rnd = random.Random(1)
+    return [(i * 1.0, 19 + rnd.gauss(0, 0.5), 20.0) for i in range(300)]
+
+
+def _irregular_dt():
+    rnd = random.Random(2)
+    timestamp = 0.0
+    steps = []
+    for _ in range(300):
+        timestamp += rnd.choice([0.1, 0.5, 1, 3, 10])
+        steps.append((timestamp, 15 + 3 * math.sin(timestamp / 20), 18.0))
+    return steps
+
+
+def _windup():
+    return [(i * 1.0, 0.0 if i < 100 else 30.0, 20.0) for i in range(200)]
+
+
+def _sample_time():
+    return [(i * 0.5, 15 + i * 0.01, 20.0) for i in range(300)]
+
+
+def _set_point_resets():
+    set_points = [20.0, 25.0, 18.0, 22.0]
+    return [
+        (i * 2.0, 19 + math.sin(i / 10), set_points[i // 50]) for i in range(200)
+    ]
+
+
+# Scenario name, steps of (timestamp, source, set point), sample time, windup
+SCENARIOS = {
+    "step": (_step, None, 20),
+    "ramp": (_ramp, None, 20),
+    "noisy": (_noisy, None, 5),
+    "irregular_dt": (_irregular_dt, None, 20),
+    "windup": (_windup, None, 50),
+    "sample_time": (_sample_time, 5, 20),
+    "set_point_resets": (_set_point_resets, 3, 20),
+}
+
+
+def trace_pid(scenario, gains) -> list:
+    """Replay a scenario on a PID, set point changes reset it like the
+    sensor does"""
+
+    steps, sample_time, windup = SCENARIOS[scenario]
+    pid = PIDController(*gains)
+    pid.windup = windup
+    pid.sample_time = sample_time
+
+    trace = []
+    for timestamp, value, set_point in steps():
+        if set_point != pid.set_point:
+            pid.reset_pid()
+            pid.sample_time = sample_time
+            pid.set_point = set_point
+        pid.update(value, in_time=timestamp)
+        trace.append([pid.output, pid.p, pid.i, pid.d])
+
+    return trace
+
+
+def trace_core(scenario, gains) -> list:
+    """Replay a scenario on a controller core, through its gating"""
+
+    steps, sample_time, windup = SCENARIOS[scenario]
+    core = ControllerCore([SOURCE])
+
+    trace = []
+    for timestamp, value, set_point in steps():
+        source = core.accept(SOURCE, value, timestamp)
+        core.evaluate(source, set_point, gains, sample_time, windup, timestamp)
+        trace.append([core.state, core.evaluated, core.pid.i])
+
+    return trace
+
+
+def generate(scenario) -> dict:
+    """Returns the traces of a scenario for every gain set"""
+
+    return {
+        "scenario": scenario,
+        "gains": GAINS,
+        "pid": [trace_pid(scenario, gains) for gains in GAINS],
+        "core": [trace_core(scenario, gains) for gains in GAINS],
+    }
+
+
+def load(scenario) -> dict:
+    """Returns the stored traces of a scenario"""
+
+    with open(GOLDEN_DIR / f"{scenario}.json", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def main():
+    """Write the traces of every scenario"""
+
+    for scenario in SCENARIOS:
+        with open(GOLDEN_DIR / f"{scenario}.json", "w", encoding="utf-8") as file:
+            json.dump(generate(scenario), file)
+            file.write("\n")
+
+
+if __name__ == "__main__":
+    main()
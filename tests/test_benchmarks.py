@@ -0,0 +1,91 @@
+"""Benchmarks of the sensor pipeline, they assert the work done per event"""
+from homeassistant.const import EVENT_HOMEASSISTANT_START
+from homeassistant.helpers.template import Template
+
+from .common import (
+    CONTROLLER,
+    SOURCE,
+    async_setup_controllers,
+    get_controller,
+    run,
+)
+
+EVENTS = 1000
+CONTROLLERS = 500
+
+
+@run
+async def test_one_computation_per_event(hass):
+    """Every source change is computed once and written once if the output
+    changed, never otherwise, the sensor is never polled"""
+
+    await async_setup_controllers(hass, [CONTROLLER])
+    controller = get_controller(hass, "sensor.pid")
+    assert not controller.should_poll
+
+    computations = []
+    writes = []
+    update_sensor = controller._update_sensor
+    write_state = controller.async_write_ha_state
+
+    def counted_update(*args, **kwargs):
+        computations.append(kwargs.get("entity"))
+        update_sensor(*args, **kwargs)
+
+    def counted_write():
+        writes.append(True)
+        write_state()
+
+    controller._update_sensor = counted_update
+    controller.async_write_ha_state = counted_write
+
+    unchanged = 0
+    for index in range(EVENTS):
+        # Blocks of readings far below the set point saturate the output
+        value = index % 10 - 10 if index // 10 % 2 else 16 + index % 10
+        last_value = controller.native_value
+        last_writes = len(writes)
+
+        hass.states.async_set(SOURCE, str(value))
+        await hass.async_block_till_done()
+
+        changed = controller.native_value != last_value
+        unchanged += not changed
+        assert len(computations) == index + 1
+        assert len(writes) - last_writes == changed
+
+    assert computations == [SOURCE] * EVENTS
+    assert 0 < unchanged < EVENTS
+
+
+@run
+async def test_startup_500_controllers(hass):
+    """Setting up the platform renders no template, dependencies are
+    discovered once Home Assistant starts"""
+
+    renders = []
+    render_to_info = Template.async_render_to_info
+
+    def counted_render(template, *args, **kwargs):
+        renders.append(template)
+        return render_to_info(template, *args, **kwargs)
+
+    controllers = [
+        {**CONTROLLER, "name": f"pid {index}"} for index in range(CONTROLLERS)
+    ]
+
+    Template.async_render_to_info = counted_render
+    try:
+        await async_setup_controllers(hass, controllers, start=False)
+        setup_renders = len(renders)
+
+        hass.bus.async_fire(EVENT_HOMEASSISTANT_START)
+        await hass.async_block_till_done()
+    finally:
+        Template.async_render_to_info = render_to_info
+
+    assert setup_renders == 0
+    assert all(
+        hass.states.get(f"sensor.pid_{index}").state != "unknown"
+        for index in range(CONTROLLERS)
+    )
@@ -0,0 +1,80 @@
+"""Tests of the source filters and aggregates"""
+import random
+import statistics
+from collections import deque
+
+from custom_components.pid_controller.pidcore.filters import (
+    AGGREGATE_MAX,
+    AGGREGATE_MIN,
+    ExtremeHeap,
+    SlidingMedian,
+    SourceAggregate,
+)
+
+
+def test_extreme_heap_stays_bounded():
+    """A member changing below the top doesn't grow the heap"""
+
+    aggregate = SourceAggregate(AGGREGATE_MIN)
+    aggregate.update("sensor.low", 0)
+    for index in range(100000):
+        assert aggregate.update("sensor.high", 1 + index % 50) == 0
+
+    heap = aggregate._heap  # pylint: disable=protected-access
+    assert len(heap) == 2
+    assert len(heap._heap) <= 6  # pylint: disable=protected-access
+
+
+def test_extreme_heap_matches_values():
+    """Random updates and removals, compacted or not, keep the extreme"""
+
+    rnd = random.Random(3)
+    aggregate = SourceAggregate(AGGREGATE_MAX)
+    values = {}
+    for _ in range(20000):
+        member = f"sensor.{rnd.randrange(8)}"
+        value = rnd.choice([None, rnd.randrange(10), rnd.uniform(-5, 5)])
+        if value is None:
+            values.pop(member, None)
+        else:
+            values[member] = value
+
+        expected = max(values.values()) if values else None
+        assert aggregate.update(member, value) == expected
+
+
+def test_extreme_heap_compacts_duplicates():
+    """Compacting drops one entry per removal of equal values"""
+
+    heap = ExtremeHeap()
+    for value in (1, 1, 2, 2, 2):
+        heap.add(value)
+    for value in (2, 1, 2, 2):
+        heap.remove(value)
+
+    assert len(heap) == 1
+    assert len(heap._heap) == 1  # pylint: disable=protected-access
+    assert heap.top == 1
+    heap.remove(1)
+    assert heap.top is None
+
+
+def test_sliding_median_stays_bounded():
+    """Removed values below the heap tops don't pile up, the median matches
+    the window"""
+
+    rnd = random.Random(4)
+    median = SlidingMedian(5)
+    window = deque(maxlen=5)
+    heap = median._heap  # pylint: disable=protected-access
+    largest = 0
+    for _ in range(100000):
+        value = rnd.choice([rnd.gauss(20, 2), float(rnd.randrange(18, 23))])
+        window.append(value)
+
+        assert median.update(value) == statistics.median(window)
+        # pylint: disable=protected-access
+        largest = max(largest, len(heap._low) + len(heap._high))
+
+    assert len(heap) == 5
+    assert largest <= 16
@@ -0,0 +1,42 @@
+"""Regression tests of the PID and the controller core against the golden
+traces, regenerated with python -m tests.golden_traces"""
+import math
+
+import pytest
+
+from .golden_traces import GAINS, SCENARIOS, load, trace_core, trace_pid
+
+# Floating point noise only, any change of the control behaviour is larger
+REL_TOL = 1e-9
+ABS_TOL = 1e-12
+
+
+def assert_trace(current, stored):
+    """Both traces match sample by sample, within the tolerance"""
+
+    assert len(current) == len(stored)
+    for index, (sample, golden) in enumerate(zip(current, stored)):
+        assert all(
+            math.isclose(value, expected, rel_tol=REL_TOL, abs_tol=ABS_TOL)
+            for value, expected in zip(sample, golden)
+        ), f"sample {index}: {sample} != {golden}"
+
+
+@pytest.mark.parametrize("scenario", SCENARIOS)
+def test_pid_matches_golden(scenario):
+    """The PID reproduces the stored traces"""
+
+    golden = load(scenario)
+    assert [tuple(gains) for gains in golden["gains"]] == GAINS
+    for gains, stored in zip(GAINS, golden["pid"]):
+        assert_trace(trace_pid(scenario, gains), stored)
+
+
+
+@pytest.mark.parametrize("scenario", SCENARIOS)
+def test_core_matches_golden(scenario):
+    """The controller core, with its gating, reproduces the stored traces"""
+
+    golden = load(scenario)
+    for gains, stored in zip(GAINS, golden["core"]):
+        assert_trace(trace_core(scenario, gains), stored)
@@ -0,0 +1,48 @@
+"""Tests of the oscillation detection"""
+import math
+import subprocess
+import sys
+from pathlib import Path
+
+from custom_components.pid_controller.oscillation import detect_oscillations
+
+
+class Context:
+    """Job context that is never cancelled"""
+
+    def check_cancelled(self):
+        """Never cancelled"""
+
+    def report_progress(self, progress):
+        """Progress is ignored"""
+
+
+def test_detects_sine_only():
+    """A sustained sine oscillates with its period, a ramp doesn't"""
+
+    sine = [(t, math.sin(2 * math.pi * t / 60)) for t in range(0, 600, 5)]
+    ramp = [(t, t / 600) for t in range(0, 600, 5)]
+
+    result = detect_oscillations(Context(), [sine, ramp])
+
+    assert result[0]["oscillating"]
+    assert math.isclose(result[0]["period"], 60, rel_tol=0.1)
+    assert not result[1]["oscillating"]
+
+
+def test_import_without_numpy():
+    """numpy is only imported when an analysis runs"""
+
+    code = (
+        "import sys, homeassistant.core, custom_components.pid_controller;"
+        "print('numpy' in sys.modules)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=Path(__file__).parents[1],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert result.stdout.strip() == "False"
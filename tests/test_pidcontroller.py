@@ -0,0 +1,27 @@
+"""Tests of the PID and On/Off controllers"""
+import math
+
+from custom_components.pid_controller.pidcore.pidcontroller import PIDController
+
+DAY = 86400
+
+
+def test_restore_starts_a_new_baseline():
+    """The gap between the export and the first sample after a restore is
+    not integrated, the terms hold until the next sample"""
+
+    pid = PIDController(5, 0.1, 0)
+    pid.set_point = 20
+    for timestamp, source in enumerate([15, 16, 17]):
+        pid.update(source, in_time=timestamp * 10)
+    snapshot = pid.snapshot()
+
+    restored = PIDController()
+    restored.restore(snapshot)
+
+    restored.update(18, in_time=DAY)
+    assert restored.i == snapshot["i"]
+    assert restored.output == snapshot["output"]
+
+    restored.update(18, in_time=DAY + 10)
+    assert math.isclose(restored.i, snapshot["i"] + 0.1 * 2 * 10)
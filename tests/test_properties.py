@@ -0,0 +1,166 @@
+"""Property tests of the PID and the controller core against reference
+implementations"""
+import math
+
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+from custom_components.pid_controller.pidcore.pidcontroller import PIDController
+from custom_components.pid_controller.pidcore.runtime import ControllerCore
+
+SOURCE = "sensor.source"
+
+# Floating point noise only, the candidate sums the terms in another order
+REL_TOL = 1e-9
+ABS_TOL = 1e-9
+
+gains = st.tuples(
+    st.floats(-10, 10, allow_nan=False),
+    st.floats(-1, 1, allow_nan=False),
+    st.floats(-5, 5, allow_nan=False),
+)
+values = st.floats(-50, 50, allow_nan=False)
+# Readings with increasing timestamps, as (interval, value)
+readings = st.lists(st.tuples(st.floats(0.01, 120), values), min_size=1, max_size=60)
+
+
+def timestamps(samples):
+    """Returns (timestamp, value) from (interval, value)"""
+
+    timestamp = 0.0
+    for interval, value in samples:
+        timestamp += interval
+        yield timestamp, value
+
+
+def reference_pid(pid_gains, set_point, windup, samples):
+    """Textbook PID, one output per sample. The first sample integrates over
+    a zero dt, the integral is clamped to the windup and frozen while the
+    output is saturated at 0 or 100"""
+
+    kp, ki, kd = pid_gains
+    integral = 0.0
+    output = None
+    last_error = 0.0
+    last_time = None
+
+    for timestamp, value in samples:
+        delta_time = timestamp - last_time if last_time is not None else 1e-16
+        error = set_point - value
+
+        if output is None or 0 < output < 100:
+            integral += ki * error * delta_time
+            if windup:
+                integral = max(min(integral, windup), -windup)
+
+        derivative = kd * (error - last_error) / delta_time
+        output = max(min(kp * error + integral + derivative, 100), 0)
+        yield output, integral
+
+        last_error = error
+        last_time = timestamp
+
+
+@settings(deadline=None)
+@given(gains, st.sampled_from([0, 1, 20, 100]), values, readings)
+def test_pid_matches_reference(pid_gains, windup, set_point, samples):
+    """The PID computes the reference output and integral on every sample"""
+
+    pid = PIDController(*pid_gains)
+    pid.windup = windup
+    pid.set_point = set_point
+
+    samples = list(timestamps(samples))
+    expected = reference_pid(pid_gains, set_point, windup, samples)
+    for (timestamp, value), (output, integral) in zip(samples, expected):
+        pid.update(value, in_time=timestamp)
+
+        assert math.isclose(pid.output, output, rel_tol=REL_TOL, abs_tol=ABS_TOL)
+        assert math.isclose(pid.i, integral, rel_tol=REL_TOL, abs_tol=ABS_TOL)
+
+
+@settings(deadline=None)
+@given(gains, st.floats(0.5, 100), values, readings)
+def test_pid_respects_limits(pid_gains, windup, set_point, samples):
+    """The output stays within the limits and the integral within the
+    windup"""
+
+    pid = PIDController(*pid_gains)
+    pid.windup = windup
+    pid.set_point = set_point
+
+    for timestamp, value in timestamps(samples):
+        pid.update(value, in_time=timestamp)
+
+        assert 0 <= pid.output <= 100
+        assert -windup <= pid.i <= windup
+
+
+@settings(deadline=None)
+@given(gains, st.sampled_from([1, 5, 30]), values, readings)
+def test_sample_time_holds_the_output(pid_gains, sample_time, set_point, samples):
+    """With a sample time the PID computes the reference on the samples at
+    least a sample time apart, and holds the output in between"""
+
+    pid = PIDController(*pid_gains)
+    pid.windup = 20
+    pid.sample_time = sample_time
+    pid.set_point = set_point
+
+    samples = list(timestamps(samples))
+    computed = []
+    for timestamp, value in samples:
+        if not computed or timestamp - computed[-1][0] >= sample_time:
+            computed.append((timestamp, value))
+
+    expected = dict(zip(computed, reference_pid(pid_gains, set_point, 20, computed)))
+    output = None
+    for sample in samples:
+        pid.update(sample[1], in_time=sample[0])
+        if sample in expected:
+            output = expected[sample][0]
+
+        assert math.isclose(pid.output, output, rel_tol=REL_TOL, abs_tol=ABS_TOL)
+
+
+@settings(deadline=None)
+@given(
+    st.lists(gains, min_size=1, max_size=3),
+    st.sampled_from([None, 0, 5, 30, 60]),
+    readings,
+)
+def test_fast_path_matches_full_path(gain_sets, sample_time, samples):
+    """The sample time fast path drops only the samples the PID discards,
+    also when the gains change between readings"""
+
+    fast = ControllerCore([SOURCE])
+    full = ControllerCore([SOURCE])
+
+    for index, (timestamp, value) in enumerate(timestamps(samples)):
+        core_gains = gain_sets[index % len(gain_sets)]
+        for core, fast_path in ((fast, True), (full, False)):
+            source = core.accept(SOURCE, value, timestamp, fast_path=fast_path)
+            core.evaluate(source, 20, core_gains, sample_time, 20, timestamp)
+
+        assert fast.state == full.state
+        assert fast.evaluated == full.evaluated
+        assert fast.pid.last_time == full.pid.last_time
+
+
+@settings(deadline=None)
+@given(gains, readings, st.integers(0, 59))
+def test_core_snapshot_round_trip(core_gains, samples, split):
+    """A restored core has the output and the PID terms of the snapshot,
+    the sample time baseline starts over"""
+
+    core = ControllerCore([SOURCE])
+    samples = list(timestamps(samples))
+    for timestamp, value in samples[:split]:
+        core.evaluate(value, 20, core_gains, None, 20, timestamp)
+
+    restored = ControllerCore([SOURCE])
+    restored.restore(core.snapshot())
+
+    assert restored.state == core.state
+    if core.pid is not None:
+        assert restored.pid.snapshot() == {**core.pid.snapshot(), "last_time": None}
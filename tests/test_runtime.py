@@ -0,0 +1,182 @@
+"""Tests of the controller core and the headless runtime"""
+import asyncio
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from custom_components.pid_controller.pidcore.pidcontroller import OnOffController
+from custom_components.pid_controller.pidcore.runtime import (
+    Controller,
+    ControllerCore,
+    MemorySink,
+    Runtime,
+)
+
+SOURCE = "sensor.source"
+
+
+def test_reset_clears_on_off_dwell():
+    """A reset forgets the On/Off state, the minimum off time no longer
+    holds the output off"""
+
+    core = ControllerCore([SOURCE], on_off=OnOffController(min_off_time=600))
+
+    assert core.switch(15, 20, False, 0)
+    assert core.state == 100
+    assert core.switch(25, 20, False, 10)
+    assert not core.switch(15, 20, False, 20)
+    assert core.state == 0
+
+    core.reset()
+
+    assert core.on_off.is_on is None
+    assert core.switch(15, 20, False, 30)
+    assert core.state == 100
+
+
+@pytest.mark.parametrize("max_interval", [30, 100, 10000])
+def test_send_on_delta_integrates_skipped_readings(max_interval):
+    """The integral over readings skipped by send on delta is the one of
+    evaluating every reading"""
+
+    skipping = ControllerCore([SOURCE], source_delta=1, max_interval=max_interval)
+    every = ControllerCore([SOURCE])
+
+    for index in range(50):
+        timestamp = index * 2
+        value = 19.5 + 0.001 * index
+        for core in (skipping, every):
+            source = core.accept(SOURCE, value, timestamp)
+            core.evaluate(source, 20, (5, 0.1, 0), None, 20, timestamp)
+
+        assert skipping.pid.i == pytest.approx(every.pid.i, rel=1e-9)
+
+    assert skipping.skipped >= 46
+
+def test_fast_path_matches_full_path():
+    """Samples dropped by the sample time fast path are the ones the PID
+    discards, also after the gains change"""
+
+    fast = ControllerCore([SOURCE])
+    full = ControllerCore([SOURCE])
+    gains = (5, 0.1, 0)
+
+    def sample(core, fast_path, value, timestamp):
+        source = core.accept(SOURCE, value, timestamp, fast_path=fast_path)
+        if source is not None:
+            core.evaluate(source, 20, gains, 60, 20, timestamp)
+
+    readings = [(15, 0), (16, 40), (17, 65), (18, 101), (19, 130), (20, 170)]
+    for index, (value, timestamp) in enumerate(readings):
+        if index == 1:
+            gains = (6, 0.1, 0)
+            for core in (fast, full):
+                core.evaluate(None, 20, gains, 60, 20, timestamp - 10)
+
+        sample(fast, True, value, timestamp)
+        sample(full, False, value, timestamp)
+
+        assert fast.state == full.state
+        assert fast.pid.last_time == full.pid.last_time
+        assert fast.evaluated == full.evaluated
+
+    assert fast.evaluated == 3
+    assert fast.pid.last_time == 130
+
+
+def test_core_imports_without_home_assistant():
+    """The core package runs a controller with Home Assistant unavailable"""
+
+    code = """
+import asyncio
+import sys
+
+sys.modules["homeassistant"] = None
+from pidcore import Controller, ControllerCore, MemorySink, OutputSink, Runtime
+
+try:
+    OutputSink()
+except TypeError:
+    pass
+else:
+    raise AssertionError("OutputSink is abstract")
+
+
+async def main():
+    sink = MemorySink()
+    runtime = Runtime(sink)
+    runtime.registry.add(
+        Controller("pid", ControllerCore(["sensor.source"]), 20, (5, 0.1, 0))
+    )
+    runtime.start()
+    runtime.publish("sensor.source", 15, 0)
+    await runtime.join()
+    await runtime.stop()
+    assert sink.values["pid"] > 0, sink.values
+
+
+asyncio.run(main())
+"""
+    path = Path(__file__).parents[1] / "custom_components" / "pid_controller"
+    subprocess.run([sys.executable, "-c", code], cwd=path, check=True)
+
+
+@pytest.mark.parametrize(
+    "core, sample_time",
+    [(ControllerCore([SOURCE]), 60), (ControllerCore([SOURCE], source_delta=1), 0)],
+    ids=["sample_time", "source_delta"],
+)
+def test_set_point_change_is_evaluated(core, sample_time):
+    """A set point change reaches the PID with the next reading, also when
+    the source is unchanged inside the sample time or the delta band"""
+
+    async def main():
+        sink = MemorySink()
+        runtime = Runtime(sink)
+        controller = Controller("pid", core, 20, (5, 0.1, 0), sample_time)
+        runtime.registry.add(controller)
+        runtime.start()
+
+        runtime.publish(SOURCE, 15, 0)
+        await runtime.join()
+        before = sink.values["pid"]
+
+        controller.set_point = 25
+        runtime.publish(SOURCE, 15, 10)
+        await runtime.join()
+        await runtime.stop()
+        return before, sink.values["pid"]
+
+    before, after = asyncio.run(main())
+
+    assert before == 0.25
+    assert after == 0.5
+    assert core.evaluated == 2
+
+def test_scheduler_yields_between_batches():
+    """Other tasks run while a long queue is drained"""
+
+    async def main():
+        runtime = Runtime(MemorySink(), queue_size=0, batch_size=100)
+        runtime.registry.add(Controller("pid", ControllerCore([SOURCE]), 20))
+        for index in range(5000):
+            runtime.publish(SOURCE, 15, index)
+
+        seen = []
+
+        async def watch():
+            while runtime.pending:
+                seen.append(runtime.received)
+                await asyncio.sleep(0)
+
+        runtime.start()
+        await asyncio.gather(watch(), runtime.join())
+        await runtime.stop()
+        return seen
+
+    seen = asyncio.run(main())
+
+    assert len(set(seen)) > 10
+    assert 0 < seen[-1] < 5000
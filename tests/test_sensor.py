@@ -0,0 +1,193 @@
+"""Tests of the PID Controller sensor"""
+from datetime import timedelta
+from unittest.mock import patch
+
+from homeassistant.const import EVENT_HOMEASSISTANT_START
+from homeassistant.core import CoreState
+from homeassistant.helpers.event import async_track_template_result
+
+from .common import (
+    CONTROLLER,
+    SOURCE,
+    async_setup_controllers,
+    get_controller,
+    run,
+)
+
+
+@run
+async def test_setup_while_starting(hass):
+    """A platform set up after the start event, while Home Assistant is
+    still starting, starts its controllers"""
+
+    hass.set_state(CoreState.starting)
+    await async_setup_controllers(hass, [CONTROLLER], start=False)
+    await hass.async_block_till_done()
+
+    hass.states.async_set(SOURCE, "16")
+    await hass.async_block_till_done()
+
+    assert hass.states.get("sensor.pid").state not in ("unknown", "unavailable")
+
+
+@run
+async def test_setup_waits_for_start(hass):
+    """Controllers set up before Home Assistant starts wait for it"""
+
+    await async_setup_controllers(hass, [CONTROLLER], start=False)
+    assert hass.states.get("sensor.pid").state == "unknown"
+
+    hass.bus.async_fire(EVENT_HOMEASSISTANT_START)
+    await hass.async_block_till_done()
+    assert hass.states.get("sensor.pid").state != "unknown"
+
+
+@run
+async def test_set_point_change_is_written(hass):
+    """A set point change is recorded even when the output holds"""
+
+    await async_setup_controllers(hass, [{**CONTROLLER, "p": "0", "i": "0"}])
+    hass.states.async_set(SOURCE, "16")
+    await hass.async_block_till_done()
+    state = hass.states.get("sensor.pid").state
+
+    for set_point in (21, 22):
+        hass.states.async_set("input_number.set_point", str(set_point))
+        await hass.async_block_till_done()
+
+        assert hass.states.get("sensor.pid").state == state
+        assert hass.states.get("sensor.pid").attributes["set_point"] == set_point
+
+
+def fleet_with_rate_limits(*rate_limits):
+    """Returns a fleet sharing the P template, a controller by rate limit"""
+
+    controllers = []
+    for index, rate_limit in enumerate(rate_limits):
+        controller = {"name": f"pid {'abc'[index]}", "entity_id": SOURCE}
+        if rate_limit is not None:
+            controller["rate_limit"] = rate_limit
+        controllers.append(controller)
+
+    return {
+        "platform": "pid_controller",
+        "p": "{{ states('input_number.p') }}",
+        "set_point": "20",
+        "controllers": controllers,
+    }
+
+
+def shared_p_rate_limit(hass):
+    """Returns the rate limit the fleet tracks the P template with"""
+
+    # pylint: disable=protected-access
+    controller = get_controller(hass, "sensor.pid_a")
+    return controller._template_group.rate_limits[controller._templates["p"]]
+
+@run
+async def test_fleet_shared_template_lowest_rate_limit(hass):
+    """A template shared by a fleet is tracked with the lowest rate limit
+    set by its controllers"""
+
+    await async_setup_controllers(hass, [fleet_with_rate_limits({"p": 30}, {"p": 5})])
+
+    assert shared_p_rate_limit(hass) == timedelta(seconds=5)
+
+
+@run
+async def test_fleet_shared_template_unlimited_member(hass):
+    """A controller without a rate limit keeps the shared template
+    unlimited, also for the others"""
+
+    await async_setup_controllers(hass, [fleet_with_rate_limits({"p": 30}, None)])
+
+    assert shared_p_rate_limit(hass) is None
+
+
+@run
+async def test_shared_field_template_unlimited_field(hass):
+    """A template used by two fields is rate limited only if both are"""
+
+    template = "{{ states('input_number.p') }}"
+    controllers = [
+        {**CONTROLLER, "name": "limited", "p": template, "i": template},
+        {**CONTROLLER, "name": "unlimited", "p": template, "i": template},
+    ]
+    controllers[0]["rate_limit"] = {"p": 30, "i": 10}
+    controllers[1]["rate_limit"] = {"p": 30}
+
+    with patch(
+        "custom_components.pid_controller.sensor.async_track_template_result",
+        wraps=async_track_template_result,
+    ) as track:
+        await async_setup_controllers(hass, controllers)
+
+    rate_limits = [
+        track_template.rate_limit
+        for call in track.call_args_list
+        for track_template in call.args[1]
+        if track_template.template.template == template
+    ]
+    assert rate_limits == [timedelta(seconds=10), None]
+
+
+@run
+async def test_set_point_change_keeps_on_off_dwell(hass):
+    """A set point change resets the PID but the output holds for its
+    minimum on time"""
+
+    await async_setup_controllers(
+        hass, [{**CONTROLLER, "p": "0", "i": "0", "min_on_time": 600}]
+    )
+    hass.states.async_set(SOURCE, "16")
+    await hass.async_block_till_done()
+    state = hass.states.get("sensor.pid").state
+
+    hass.states.async_set("input_number.set_point", "21")
+    await hass.async_block_till_done()
+    hass.states.async_set(SOURCE, "25")
+    await hass.async_block_till_done()
+
+    assert hass.states.get("sensor.pid").state == state
+
+
+@run
+async def test_metrics_are_not_recorded(hass):
+    """Metrics and counters are shown but left out of the recorder"""
+
+    await async_setup_controllers(hass, [CONTROLLER])
+    hass.states.async_set(SOURCE, "16")
+    await hass.async_block_till_done()
+
+    state = hass.states.get("sensor.pid")
+    attributes = state.attributes
+    unrecorded = state.state_info["unrecorded_attributes"]
+
+    assert {"iae", "travel", "evaluated", "skipped"} <= attributes.keys()
+    assert {"iae", "travel", "evaluated", "skipped"} <= unrecorded
+    assert "set_point" not in unrecorded
+
+
+@run
+async def test_shed_reading_is_evaluated_when_shedding_ends(hass):
+    """The last reading shed under lag is evaluated once the lag recovers,
+    not left waiting for a next reading"""
+
+    await async_setup_controllers(hass, [CONTROLLER])
+    controller = get_controller(hass, "sensor.pid")
+    hass.states.async_set(SOURCE, "16")
+    await hass.async_block_till_done()
+    state = hass.states.get("sensor.pid").state
+
+    controller.async_set_stretch(10)
+    hass.states.async_set(SOURCE, "25")
+    await hass.async_block_till_done()
+
+    assert controller.shed == 1
+    assert hass.states.get("sensor.pid").state == state
+
+    controller.async_set_stretch(1)
+    await hass.async_block_till_done()
+
+    assert hass.states.get("sensor.pid").state != state
+    assert controller.evaluated == 2
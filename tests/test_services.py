@@ -0,0 +1,91 @@
+"""Tests of the PID Controller services"""
+import pytest
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import area_registry, entity_registry
+
+from .common import CONTROLLER, async_setup_controllers, run
+
+
+@run
+async def test_area_target_only_controllers(hass):
+    """An area expands to the controllers in it, other entities there are
+    left out of the results"""
+
+    await async_setup_controllers(hass, [{**CONTROLLER, "unique_id": "pid"}])
+
+    area = area_registry.async_get(hass).async_create("Living room")
+    registry = entity_registry.async_get(hass)
+    lamp = registry.async_get_or_create(
+        "light", "demo", "lamp", suggested_object_id="lamp"
+    )
+    hass.states.async_set(lamp.entity_id, "on")
+    for entity_id in ("sensor.pid", lamp.entity_id):
+        registry.async_update_entity(entity_id, area_id=area.id)
+
+    result = await hass.services.async_call(
+        "pid_controller",
+        "reset_pid",
+        {"area_id": area.id},
+        blocking=True,
+        return_response=True,
+    )
+
+    assert result == {"sensor.pid": {"success": True}}
+
+
+@run
+async def test_entity_target_reports_other_entities(hass):
+    """An entity named in the target that isn't a controller has a failed
+    result"""
+
+    await async_setup_controllers(hass, [CONTROLLER])
+    hass.states.async_set("light.lamp", "on")
+
+    result = await hass.services.async_call(
+        "pid_controller",
+        "reset_pid",
+        {"entity_id": ["sensor.pid", "light.lamp"]},
+        blocking=True,
+        return_response=True,
+    )
+
+    assert result["sensor.pid"] == {"success": True}
+    assert not result["light.lamp"]["success"]
+
+
+@run
+async def test_state_custom_filename(hass):
+    """A custom file name is kept in the config folder, paths out of it are
+    rejected"""
+
+    await async_setup_controllers(hass, [CONTROLLER])
+
+    result = await hass.services.async_call(
+        "pid_controller",
+        "export_state",
+        {"filename": "pid_backup.json"},
+        blocking=True,
+        return_response=True,
+    )
+    assert result == {
+        "filename": hass.config.path("pid_backup.json"),
+        "controllers": ["sensor.pid"],
+    }
+
+    result = await hass.services.async_call(
+        "pid_controller",
+        "import_state",
+        {"filename": "pid_backup.json"},
+        blocking=True,
+        return_response=True,
+    )
+    assert result["sensor.pid"]["success"]
+
+    with pytest.raises(HomeAssistantError, match="not an allowed path"):
+        await hass.services.async_call(
+            "pid_controller",
+            "export_state",
+            {"filename": "../pid.json"},
+            blocking=True,
+            return_response=True,
+        )